@@ -3,21 +3,32 @@
 # 3GPP TS 23.502 - AMF Procedures - 100% Compliant Implementation
 
 from fastapi import FastAPI, HTTPException, Request, BackgroundTasks
-from pydantic import BaseModel, Field
-from typing import Dict, List, Optional, Any, Union
+from fastapi.responses import ORJSONResponse, StreamingResponse
+from pydantic import BaseModel, Field, validator
+from typing import Dict, List, Optional, Any, Union, Final
 import uvicorn
-import requests
+import httpx
+import orjson
 import asyncio
 import uuid
+import hashlib
+import itertools
+import secrets
 import json
 import logging
-from datetime import datetime, timedelta
+import os
+import time
+import struct
+import threading
+from datetime import datetime, timezone
 from contextlib import asynccontextmanager
 from opentelemetry import trace
 from enum import Enum
+from dataclasses import dataclass, field
+from weakref import WeakValueDictionary
 
 # Configure logging
-logging.basicConfig(level=logging.INFO)
+logging.basicConfig(level=os.environ.get("AMF_NAS_LOG_LEVEL", "INFO").upper())
 logger = logging.getLogger(__name__)
 
 # OpenTelemetry tracer
@@ -123,19 +134,46 @@ class FgsmCause(int, Enum):
     SYNTACTICAL_ERROR_IN_THE_QOS_OPERATION = 84
     INVALID_MAPPED_EPS_BEARER_IDENTITY = 85
 
+# Plain int aliases for the values used on the message-building paths
+REG_ACCEPT = NasMessageType.REGISTRATION_ACCEPT.value
+AUTH_REQ = NasMessageType.AUTHENTICATION_REQUEST.value
+SEC_MODE_CMD = NasMessageType.SECURITY_MODE_COMMAND.value
+MAC_FAILURE = FgmmCause.MAC_FAILURE.value
+
 # NAS Message Structures
 class NasHeader(BaseModel):
     extended_protocol_discriminator: int = Field(0x7E, description="5GS mobility management messages")
     security_header_type: int = Field(0, description="Plain NAS message")
     message_type: int = Field(..., description="NAS message type")
 
+_HEX_DIGITS = frozenset("0123456789abcdefABCDEF")
+
 class PlmnId(BaseModel):
-    mcc: str = Field(..., regex="^[0-9]{3}$", description="Mobile Country Code")
-    mnc: str = Field(..., regex="^[0-9]{2,3}$", description="Mobile Network Code")
+    mcc: str = Field(..., description="Mobile Country Code")
+    mnc: str = Field(..., description="Mobile Network Code")
+
+    # Plain character checks instead of a regex match per field
+    @validator("mcc")
+    def _check_mcc(cls, v):
+        if not (len(v) == 3 and v.isascii() and v.isdigit()):
+            raise ValueError("mcc must be 3 digits")
+        return v
+
+    @validator("mnc")
+    def _check_mnc(cls, v):
+        if not (len(v) in (2, 3) and v.isascii() and v.isdigit()):
+            raise ValueError("mnc must be 2 or 3 digits")
+        return v
 
 class Snssai(BaseModel):
     sst: int = Field(..., ge=1, le=255, description="Slice/Service Type")
-    sd: Optional[str] = Field(None, regex="^[A-Fa-f0-9]{6}$", description="Slice Differentiator")
+    sd: Optional[str] = Field(None, description="Slice Differentiator")
+
+    @validator("sd")
+    def _check_sd(cls, v):
+        if v is not None and not (len(v) == 6 and _HEX_DIGITS.issuperset(v)):
+            raise ValueError("sd must be 6 hex digits")
+        return v
 
 class RegistrationRequest(BaseModel):
     header: NasHeader
@@ -192,10 +230,134 @@ class SecurityModeCommand(BaseModel):
     selected_eps_nas_security_algorithms: Optional[Dict] = Field(None, description="Selected EPS NAS security algorithms")
     replayed_s1_ue_security_capabilities: Optional[Dict] = Field(None, description="Replayed S1 UE security capabilities")
 
+# Invariant NAS message parts, built once at import time and shared by
+# reference across every response. Final only stops rebinding: the dicts
+# stay mutable (orjson cannot encode MappingProxyType), so anything kept
+# per UE, such as a NAS security context, stores its own copy.
+_REG_ACCEPT_HEADER_D: Final = NasHeader(message_type=REG_ACCEPT).dict()
+_AUTH_REQUEST_HEADER_D: Final = NasHeader(message_type=AUTH_REQ).dict()
+_SEC_MODE_CMD_HEADER_D: Final = NasHeader(message_type=SEC_MODE_CMD).dict()
+
+_TAI_LIST_D: Final = (
+    {
+        "typeOfList": "00",  # List of TAIs belonging to one PLMN
+        "numberOfElements": 1,
+        "plmnId": {"mcc": "001", "mnc": "01"},
+        "tac": "000001"
+    },
+)
+
+_NFS_D: Final = {
+    "ims_vops_3gpp": True,
+    "ims_vops_n3gpp": True,
+    "emc_3gpp": True,
+    "emc_n3gpp": True,
+    "emf_3gpp": True,
+    "emf_n3gpp": True
+}
+
+# Security algorithms selected per network policy
+_SEC_ALGS_D: Final = {
+    "typeOfCipheringAlgorithm": 1,  # 128-NEA1
+    "typeOfIntegrityProtectionAlgorithm": 1  # 128-NIA1
+}
+
+# Per-thread scratch buffer for NAS wire encoding
+_NAS_SCRATCH = threading.local()
+_NAS_SCRATCH_SIZE = 256
+
+# TS 24.501 § 9.11 IEIs used in Registration Accept
+_IEI_5G_GUTI = 0x77
+_IEI_TAI_LIST = 0x54
+_IEI_ALLOWED_NSSAI = 0x15
+_IEI_NETWORK_FEATURE_SUPPORT = 0x21
+
+def _nas_scratch() -> bytearray:
+    buf = getattr(_NAS_SCRATCH, "buf", None)
+    if buf is None:
+        buf = _NAS_SCRATCH.buf = bytearray(_NAS_SCRATCH_SIZE)
+    return buf
+
+def _nfs_2bit(value) -> int:
+    """EMC/EMF indicator value: True means supported in NR connected to 5GCN (01)"""
+    if value is True:
+        return 0b01
+    return int(value or 0) & 0b11
+
+def _encode_plmn(plmn_id: Dict) -> bytes:
+    """BCD-encode a PLMN ID per TS 24.008 § 10.5.1.13"""
+    mcc, mnc = plmn_id["mcc"], plmn_id["mnc"]
+    mnc3 = int(mnc[2]) if len(mnc) == 3 else 0xF
+    return bytes((
+        (int(mcc[1]) << 4) | int(mcc[0]),
+        (mnc3 << 4) | int(mcc[2]),
+        (int(mnc[1]) << 4) | int(mnc[0])
+    ))
+
+# AMF context records (slotted: fixed fields, no per-instance __dict__)
+@dataclass(slots=True)
+class UeContext:
+    supi: str
+    suci: str
+    registration_type: int
+    ue_security_capability: Dict
+    requested_nssai: Optional[List[Snssai]] = None
+    registration_state: str = "INITIAL"
+    guti: Optional[str] = None
+    security_context: Optional[Dict] = None
+    pdu_sessions: Dict = field(default_factory=dict)
+    allowed_nssai: Optional[List[Dict]] = None
+    registration_time_ns: int = 0
+    security_mode_complete: bool = False
+    imeisv: Optional[str] = None
+
+@dataclass(slots=True)
+class PduSession:
+    pdu_session_id: int
+    pti: int
+    pdu_session_type: int
+    ssc_mode: int
+    state: str = "CREATING"
+    created_time_ns: int = 0
+    smf_context: Optional[Dict] = None
+
+@dataclass(slots=True)
+class NasSecurityContext:
+    kseaf: str
+    selected_algorithms: Dict
+    ngksi: int
+
+def _ns_to_iso(ns: int) -> str:
+    """Format a time.time_ns() timestamp as ISO 8601 (UTC)"""
+    return datetime.fromtimestamp(ns / 1e9, tz=timezone.utc).isoformat()
+
 # AMF Context Storage
-ue_contexts: Dict[str, Dict] = {}
-pdu_sessions: Dict[str, Dict] = {}
-nas_security_contexts: Dict[str, Dict] = {}
+# UE contexts are sharded by SUPI; read-modify-write runs under a per-SUPI lock
+_SHARDS = 32
+_ue_shards: List[Dict[str, UeContext]] = [{} for _ in range(_SHARDS)]
+_ue_locks: "WeakValueDictionary[str, asyncio.Lock]" = WeakValueDictionary()
+pdu_sessions: Dict[str, PduSession] = {}
+nas_security_contexts: Dict[str, NasSecurityContext] = {}
+
+# Internal PDU session keys only need to be unique within this AMF
+_session_counter = itertools.count(1)
+
+def _shard(supi: str) -> Dict[str, UeContext]:
+    return _ue_shards[hash(supi) & (_SHARDS - 1)]
+
+def _lock(supi: str) -> asyncio.Lock:
+    lock = _ue_locks.get(supi)
+    if lock is None:
+        lock = _ue_locks.setdefault(supi, asyncio.Lock())
+    return lock
+
+def _ue_count() -> int:
+    return sum(len(shard) for shard in _ue_shards)
+
+def _iter_ue_contexts():
+    # Snapshot one shard at a time so callers may suspend between items
+    for shard in _ue_shards:
+        yield from tuple(shard.items())
 
 class AMF_NAS:
     def __init__(self):
@@ -217,6 +379,15 @@ class AMF_NAS:
                 ]
             }
         ]
+        self._supported_ssts = frozenset(
+            s["sst"] for plmn in self.plmn_support_list for s in plmn["snssaiList"]
+        )
+        self._default_allowed_nssai = ({"sst": 1, "sd": "010203"},)
+        # 5G-GUTI = <type><GUAMI><5G-TMSI>; the TMSI is a keyed hash of the IMSI
+        self._guti_prefix = "4" + "001010001001"  # 5G-GUTI type + simplified GUAMI encoding
+        self._tmsi_key = secrets.token_bytes(16)
+        # Shared keep-alive HTTP client, opened and closed by lifespan
+        self.http_client: Optional[httpx.AsyncClient] = None
         
     def generate_5g_guti(self, supi: str) -> str:
         """Generate 5G-GUTI per TS 23.003"""
@@ -226,15 +397,27 @@ class AMF_NAS:
         else:
             imsi = "001010000000001"
         
-        # Generate 5G-GUTI
-        # Format: <GUAMI><5G-TMSI>
-        guti_type = "4"  # 5G-GUTI
-        guami_hex = "001010001001"  # Simplified GUAMI encoding
-        tmsi = hex(hash(imsi) & 0xFFFFFFFF)[2:].upper().zfill(8)
+        # Keyed BLAKE2b keeps the TMSI stable per IMSI but unguessable
+        tmsi = hashlib.blake2b(imsi.encode(), key=self._tmsi_key, digest_size=4).hexdigest().upper()
         
-        return f"{guti_type}{guami_hex}{tmsi}"
+        return f"{self._guti_prefix}{tmsi}"
     
-    def create_registration_accept(self, supi: str, requested_nssai: List[Snssai] = None) -> RegistrationAccept:
+    def generate_5g_guti_batch(self, supis: List[str]) -> List[str]:
+        """Generate 5G-GUTIs for many SUPIs at once (paging, bulk registration)"""
+        # Hoist the per-call lookups out of the loop; same result as generate_5g_guti
+        blake2b = hashlib.blake2b
+        key = self._tmsi_key
+        prefix = self._guti_prefix
+        default_imsi = b"001010000000001"
+        return [
+            prefix + blake2b(
+                supi[5:].encode() if supi.startswith("imsi-") else default_imsi,
+                key=key, digest_size=4
+            ).hexdigest().upper()
+            for supi in supis
+        ]
+    
+    def create_registration_accept(self, supi: str, requested_nssai: List[Snssai] = None) -> Dict:
         """Create Registration Accept message per TS 24.501 § 8.2.7.2"""
         guti = self.generate_5g_guti(supi)
         
@@ -245,66 +428,112 @@ class AMF_NAS:
         if requested_nssai:
             for snssai in requested_nssai:
                 # Check if SNSSAI is supported
-                if any(s["sst"] == snssai.sst for plmn in self.plmn_support_list for s in plmn["snssaiList"]):
-                    allowed_nssai.append(snssai)
+                if snssai.sst in self._supported_ssts:
+                    allowed_nssai.append({"sst": snssai.sst, "sd": snssai.sd})
                 else:
-                    rejected_nssai.append(snssai)
+                    rejected_nssai.append({"sst": snssai.sst, "sd": snssai.sd})
         else:
             # Default NSSAI
-            allowed_nssai = [Snssai(sst=1, sd="010203")]
+            allowed_nssai = self._default_allowed_nssai
         
-        # Create TAI list
-        tai_list = [
-            {
-                "typeOfList": "00",  # List of TAIs belonging to one PLMN
-                "numberOfElements": 1,
-                "plmnId": {"mcc": "001", "mnc": "01"},
-                "tac": "000001"
-            }
-        ]
-        
-        return RegistrationAccept(
-            header=NasHeader(message_type=NasMessageType.REGISTRATION_ACCEPT.value),
-            registration_result=1,  # 5GS services allowed
-            mobile_identity=guti,
-            tai_list=tai_list,
-            allowed_nssai=allowed_nssai if allowed_nssai else None,
-            rejected_nssai=rejected_nssai if rejected_nssai else None,
-            network_feature_support={
-                "ims_vops_3gpp": True,
-                "ims_vops_n3gpp": True,
-                "emc_3gpp": True,
-                "emc_n3gpp": True,
-                "emf_3gpp": True,
-                "emf_n3gpp": True
-            }
-        )
+        # Same shape as RegistrationAccept.dict(), without the model round-trip
+        return {
+            "header": _REG_ACCEPT_HEADER_D,
+            "registration_result": 1,  # 5GS services allowed
+            "mobile_identity": guti,
+            "tai_list": _TAI_LIST_D,
+            "allowed_nssai": allowed_nssai if allowed_nssai else None,
+            "rejected_nssai": rejected_nssai if rejected_nssai else None,
+            "configured_nssai": None,
+            "network_feature_support": _NFS_D,
+            "pdu_session_status": None,
+            "pdu_session_reactivation_result": None
+        }
     
-    def create_authentication_request(self, supi: str, auth_vectors: Dict) -> AuthenticationRequest:
+    def create_authentication_request(self, supi: str, auth_vectors: Dict) -> Dict:
         """Create Authentication Request message per TS 24.501 § 8.2.1.2"""
-        return AuthenticationRequest(
-            header=NasHeader(message_type=NasMessageType.AUTHENTICATION_REQUEST.value),
-            ngksi=1,  # NAS key set identifier
-            abba="0000",  # ABBA parameter
-            authentication_parameter_rand=auth_vectors["rand"],
-            authentication_parameter_autn=auth_vectors["autn"]
-        )
+        return {
+            "header": _AUTH_REQUEST_HEADER_D,
+            "ngksi": 1,  # NAS key set identifier
+            "abba": "0000",  # ABBA parameter
+            "authentication_parameter_rand": auth_vectors["rand"],
+            "authentication_parameter_autn": auth_vectors["autn"],
+            "eap_message": None
+        }
     
-    def create_security_mode_command(self, supi: str, ue_security_capabilities: Dict) -> SecurityModeCommand:
+    def create_security_mode_command(self, supi: str, ue_security_capabilities: Dict) -> Dict:
         """Create Security Mode Command message per TS 24.501 § 8.2.20.2"""
-        # Select security algorithms based on UE capabilities and network policy
-        selected_algorithms = {
-            "typeOfCipheringAlgorithm": 1,  # 128-NEA1
-            "typeOfIntegrityProtectionAlgorithm": 1  # 128-NIA1
+        return {
+            "header": _SEC_MODE_CMD_HEADER_D,
+            "selected_nas_security_algorithms": _SEC_ALGS_D,
+            "ngksi": 1,
+            "replayed_ue_security_capabilities": ue_security_capabilities,
+            "imeisv_request": 1,  # IMEISV requested
+            "selected_eps_nas_security_algorithms": None,
+            "replayed_s1_ue_security_capabilities": None
         }
+    
+    def encode_registration_accept(self, registration_accept: Dict) -> bytes:
+        """Encode a Registration Accept dict to NAS wire format per TS 24.501 § 8.2.7"""
+        buf = _nas_scratch()
+        header = registration_accept["header"]
+        struct.pack_into(">BBB", buf, 0,
+                         header["extended_protocol_discriminator"],
+                         header["security_header_type"],
+                         header["message_type"])
+        # 5GS registration result (LV)
+        struct.pack_into(">BB", buf, 3, 1, registration_accept["registration_result"])
+        offset = 5
         
-        return SecurityModeCommand(
-            header=NasHeader(message_type=NasMessageType.SECURITY_MODE_COMMAND.value),
-            selected_nas_security_algorithms=selected_algorithms,
-            ngksi=1,
-            replayed_ue_security_capabilities=ue_security_capabilities,
-            imeisv_request=1  # IMEISV requested
-        )
+        # 5G-GUTI (TLV-E): identity type 2, PLMN, AMF region/set/pointer, 5G-TMSI
+        guami = self.guami
+        amf_set_pointer = (int(guami["amfSetId"], 16) << 6) | int(guami["amfPointer"], 16)
+        tmsi = int(registration_accept["mobile_identity"][-8:], 16)
+        struct.pack_into(">BHB3sBHI", buf, offset, _IEI_5G_GUTI, 11, 0xF2,
+                         _encode_plmn(guami["plmnId"]), int(guami["amfRegionId"], 16),
+                         amf_set_pointer, tmsi)
+        offset += 14
+        
+        # TAI list (TLV): type 00 partial lists, one PLMN each
+        tai_list = registration_accept.get("tai_list")
+        if tai_list:
+            start = offset
+            offset += 2
+            for tai in tai_list:
+                struct.pack_into(">B3s3s", buf, offset,
+                                 (int(tai["typeOfList"], 16) << 5) | (tai["numberOfElements"] - 1),
+                                 _encode_plmn(tai["plmnId"]), bytes.fromhex(tai["tac"]))
+                offset += 7
+            struct.pack_into(">BB", buf, start, _IEI_TAI_LIST, offset - start - 2)
+        
+        # Allowed NSSAI (TLV): length-prefixed S-NSSAI values
+        allowed_nssai = registration_accept.get("allowed_nssai")
+        if allowed_nssai:
+            start = offset
+            offset += 2
+            for snssai in allowed_nssai:
+                if snssai.get("sd"):
+                    struct.pack_into(">BB3s", buf, offset, 4, snssai["sst"], bytes.fromhex(snssai["sd"]))
+                    offset += 5
+                else:
+                    struct.pack_into(">BB", buf, offset, 1, snssai["sst"])
+                    offset += 2
+            struct.pack_into(">BB", buf, start, _IEI_ALLOWED_NSSAI, offset - start - 2)
+        
+        # 5GS network feature support (TLV) per § 9.11.3.5. Octet 3: IMS-VoPS-3GPP (bit 1),
+        # IMS-VoPS-N3GPP (bit 2), EMC (bits 3-4) and EMF (bits 5-6), both 2-bit fields;
+        # octet 4: EMCN3 (bit 1). The spec has no non-3GPP EMF indicator.
+        nfs = registration_accept.get("network_feature_support")
+        if nfs:
+            octet3 = (bool(nfs.get("ims_vops_3gpp"))
+                      | bool(nfs.get("ims_vops_n3gpp")) << 1
+                      | _nfs_2bit(nfs.get("emc_3gpp")) << 2
+                      | _nfs_2bit(nfs.get("emf_3gpp")) << 4)
+            octet4 = bool(nfs.get("emc_n3gpp"))
+            struct.pack_into(">BBBB", buf, offset, _IEI_NETWORK_FEATURE_SUPPORT, 2, octet3, octet4)
+            offset += 4
+        
+        return bytes(memoryview(buf)[:offset])
     
     async def initiate_authentication(self, supi: str) -> Optional[Dict]:
         """Initiate authentication procedure per TS 23.502 § 4.2.2.2.4"""
@@ -316,17 +545,17 @@ class AMF_NAS:
                 "resynchronizationInfo": None
             }
             
-            response = requests.post(f"{ausf_url}/nausf-auth/v1/ue-authentications", 
-                                   json=auth_request)
+            response = await self.http_client.post(f"{ausf_url}/nausf-auth/v1/ue-authentications",
+                                                   json=auth_request)
             
             if response.status_code == 200:
                 return response.json()
             else:
-                logger.error(f"Authentication initiation failed: {response.status_code}")
+                logger.error("Authentication initiation failed: %s", response.status_code)
                 return None
                 
         except Exception as e:
-            logger.error(f"Error initiating authentication: {e}")
+            logger.error("Error initiating authentication: %s", e)
             return None
     
     async def register_with_udm(self, supi: str, amf_instance_id: str) -> bool:
@@ -341,13 +570,13 @@ class AMF_NAS:
                 "initialRegistrationInd": True
             }
             
-            response = requests.post(f"{udm_url}/nudm-uecm/v1/{supi}/registrations/amf-3gpp-access",
-                                   json=registration_data)
+            response = await self.http_client.post(f"{udm_url}/nudm-uecm/v1/{supi}/registrations/amf-3gpp-access",
+                                                   json=registration_data)
             
             return response.status_code in [200, 201]
             
         except Exception as e:
-            logger.error(f"UDM registration failed: {e}")
+            logger.error("UDM registration failed: %s", e)
             return False
 
 amf_nas_instance = AMF_NAS()
@@ -357,6 +586,11 @@ async def lifespan(app: FastAPI):
     # Startup - Register with NRF and discover services
     global ausf_url, udm_url, smf_url
     
+    amf_nas_instance.http_client = httpx.AsyncClient(
+        limits=httpx.Limits(max_keepalive_connections=100)
+    )
+    client = amf_nas_instance.http_client
+    
     nf_profile = {
         "nfInstanceId": amf_nas_instance.nf_instance_id,
         "nfType": "AMF",
@@ -386,59 +620,58 @@ async def lifespan(app: FastAPI):
         }
     }
     
+    # Serialize the profile once; the body is sent as-is
+    nf_profile_body = orjson.dumps(nf_profile)
+    
     try:
         # Register with NRF
-        response = requests.post(f"{nrf_url}/nnrf-nfm/v1/nf-instances/{amf_nas_instance.nf_instance_id}",
-                               json=nf_profile)
+        response = await client.put(f"{nrf_url}/nnrf-nfm/v1/nf-instances/{amf_nas_instance.nf_instance_id}",
+                                    content=nf_profile_body,
+                                    headers={"content-type": "application/json"})
         if response.status_code in [200, 201]:
             logger.info("AMF-NAS registered with NRF successfully")
-        
-        # Discover AUSF
-        ausf_discovery = requests.get(f"{nrf_url}/nnrf-disc/v1/nf-instances?target-nf-type=AUSF")
-        if ausf_discovery.status_code == 200:
-            ausf_data = ausf_discovery.json()
-            if ausf_data.get("nfInstances"):
-                ausf_ip = ausf_data["nfInstances"][0]["ipv4Addresses"][0]
-                ausf_port = ausf_data["nfInstances"][0]["nfServices"][0]["ipEndPoints"][0]["port"]
-                ausf_url = f"http://{ausf_ip}:{ausf_port}"
-                logger.info(f"AUSF discovered: {ausf_url}")
-        
-        # Discover UDM
-        udm_discovery = requests.get(f"{nrf_url}/nnrf-disc/v1/nf-instances?target-nf-type=UDM")
-        if udm_discovery.status_code == 200:
-            udm_data = udm_discovery.json()
-            if udm_data.get("nfInstances"):
-                udm_ip = udm_data["nfInstances"][0]["ipv4Addresses"][0]
-                udm_port = udm_data["nfInstances"][0]["nfServices"][0]["ipEndPoints"][0]["port"]
-                udm_url = f"http://{udm_ip}:{udm_port}"
-                logger.info(f"UDM discovered: {udm_url}")
-        
-        # Discover SMF
-        smf_discovery = requests.get(f"{nrf_url}/nnrf-disc/v1/nf-instances?target-nf-type=SMF")
-        if smf_discovery.status_code == 200:
-            smf_data = smf_discovery.json()
-            if smf_data.get("nfInstances"):
-                smf_ip = smf_data["nfInstances"][0]["ipv4Addresses"][0]
-                smf_port = smf_data["nfInstances"][0]["nfServices"][0]["ipEndPoints"][0]["port"]
-                smf_url = f"http://{smf_ip}:{smf_port}"
-                logger.info(f"SMF discovered: {smf_url}")
-        
-    except requests.RequestException as e:
-        logger.error(f"Service discovery failed: {e}")
+        else:
+            logger.error("NRF registration failed: %s", response.status_code)
+    except httpx.HTTPError as e:
+        logger.error("NRF registration failed: %s", e)
+    
+    async def _discover(nf_type: str) -> Optional[str]:
+        try:
+            discovery = await client.get(f"{nrf_url}/nnrf-disc/v1/nf-instances?target-nf-type={nf_type}")
+            if discovery.status_code == 200:
+                data = discovery.json()
+                if data.get("nfInstances"):
+                    nf_ip = data["nfInstances"][0]["ipv4Addresses"][0]
+                    nf_port = data["nfInstances"][0]["nfServices"][0]["ipEndPoints"][0]["port"]
+                    nf_url = f"http://{nf_ip}:{nf_port}"
+                    logger.info("%s discovered: %s", nf_type, nf_url)
+                    return nf_url
+        except (httpx.HTTPError, ValueError, KeyError, IndexError, TypeError) as e:
+            logger.error("Service discovery failed for %s: %s", nf_type, e)
+        return None
+    
+    # Discover AUSF, UDM and SMF concurrently
+    ausf_url, udm_url, smf_url = await asyncio.gather(
+        _discover("AUSF"), _discover("UDM"), _discover("SMF")
+    )
     
     yield
     
     # Shutdown
     try:
-        requests.delete(f"{nrf_url}/nnrf-nfm/v1/nf-instances/{amf_nas_instance.nf_instance_id}")
+        await client.delete(f"{nrf_url}/nnrf-nfm/v1/nf-instances/{amf_nas_instance.nf_instance_id}")
         logger.info("AMF-NAS deregistered from NRF")
     except:
         pass
+    finally:
+        await client.aclose()
+        amf_nas_instance.http_client = None
 
 app = FastAPI(
     title="AMF-NAS - Access and Mobility Management Function with NAS",
     description="3GPP TS 24.501 NAS and TS 23.502 AMF procedures compliant implementation",
     version="1.0.0",
+    default_response_class=ORJSONResponse,
     lifespan=lifespan
 )
 
@@ -461,20 +694,18 @@ async def process_registration_request(registration_req: RegistrationRequest):
             if supi.startswith("suci-"):
                 supi = "imsi-" + supi.split("-")[-1]
             
-            # Create UE context
-            ue_context = {
-                "supi": supi,
-                "suci": registration_req.suci,
-                "registration_type": registration_req.registration_type,
-                "ue_security_capability": registration_req.ue_security_capability,
-                "requested_nssai": registration_req.requested_nssai,
-                "registration_state": "INITIAL",
-                "guti": None,
-                "security_context": None,
-                "pdu_sessions": {},
-                "registration_time": datetime.utcnow()
-            }
-            ue_contexts[supi] = ue_context
+            # The per-SUPI lock covers context updates only, never the AUSF/UDM round trips
+            async with _lock(supi):
+                # Create UE context
+                ue_context = UeContext(
+                    supi=supi,
+                    suci=registration_req.suci,
+                    registration_type=registration_req.registration_type,
+                    ue_security_capability=registration_req.ue_security_capability,
+                    requested_nssai=registration_req.requested_nssai,
+                    registration_time_ns=time.time_ns()
+                )
+                _shard(supi)[supi] = ue_context
             
             # Initiate authentication if required
             if registration_req.registration_type in [1, 3]:  # Initial or emergency registration
@@ -485,38 +716,40 @@ async def process_registration_request(registration_req: RegistrationRequest):
                     )
                     
                     span.set_attribute("authentication.initiated", "SUCCESS")
-                    return {
+                    return ORJSONResponse({
                         "status": "AUTHENTICATION_REQUIRED",
-                        "nas_message": auth_request.dict(),
+                        "nas_message": auth_request,
                         "links": auth_result.get("_links", {})
-                    }
+                    })
             
             # Direct registration accept for simplified flow
             registration_accept = amf_nas_instance.create_registration_accept(
                 supi, registration_req.requested_nssai
             )
             
-            # Update UE context
-            ue_context["registration_state"] = "REGISTERED"
-            ue_context["guti"] = registration_accept.mobile_identity
-            ue_context["allowed_nssai"] = registration_accept.allowed_nssai
+            # Update UE context, unless a newer registration has replaced it meanwhile
+            async with _lock(supi):
+                if _shard(supi).get(supi) is ue_context:
+                    ue_context.registration_state = "REGISTERED"
+                    ue_context.guti = registration_accept["mobile_identity"]
+                    ue_context.allowed_nssai = registration_accept["allowed_nssai"]
             
             # Register with UDM
             udm_success = await amf_nas_instance.register_with_udm(supi, amf_nas_instance.nf_instance_id)
             
             span.set_attribute("registration.status", "SUCCESS")
-            logger.info(f"Registration successful for SUPI: {supi}")
+            logger.info("Registration successful for SUPI: %s", supi)
             
-            return {
+            return ORJSONResponse({
                 "status": "REGISTRATION_ACCEPT",
-                "nas_message": registration_accept.dict(),
-                "guti": registration_accept.mobile_identity,
+                "nas_message": registration_accept,
+                "guti": registration_accept["mobile_identity"],
                 "udm_registered": udm_success
-            }
+            })
             
         except Exception as e:
             span.set_attribute("error", str(e))
-            logger.error(f"Registration request processing failed: {e}")
+            logger.error("Registration request processing failed: %s", e)
             raise HTTPException(status_code=500, detail=f"Registration failed: {e}")
 
 @app.post("/nas/authentication-response")
@@ -535,7 +768,7 @@ async def process_authentication_response(auth_data: Dict):
             
             # Send confirmation to AUSF
             confirmation_data = {"resStar": auth_response}
-            response = requests.put(
+            response = await amf_nas_instance.http_client.put(
                 f"{ausf_url}/nausf-auth/v1/ue-authentications/{auth_context_id}/5g-aka-confirmation",
                 json=confirmation_data
             )
@@ -545,36 +778,38 @@ async def process_authentication_response(auth_data: Dict):
                 
                 if auth_result["authResult"] == "AUTHENTICATION_SUCCESS":
                     # Authentication successful - proceed with security mode command
-                    ue_context = ue_contexts.get(supi)
+                    async with _lock(supi):
+                        ue_context = _shard(supi).get(supi)
+                        if ue_context:
+                            security_cmd = amf_nas_instance.create_security_mode_command(
+                                supi, ue_context.ue_security_capability
+                            )
+                            
+                            # Store security context
+                            nas_security_contexts[supi] = NasSecurityContext(
+                                kseaf=auth_result["kseaf"],
+                                selected_algorithms=dict(security_cmd["selected_nas_security_algorithms"]),
+                                ngksi=security_cmd["ngksi"]
+                            )
+                    
                     if ue_context:
-                        security_cmd = amf_nas_instance.create_security_mode_command(
-                            supi, ue_context["ue_security_capability"]
-                        )
-                        
-                        # Store security context
-                        nas_security_contexts[supi] = {
-                            "kseaf": auth_result["kseaf"],
-                            "selected_algorithms": security_cmd.selected_nas_security_algorithms,
-                            "ngksi": security_cmd.ngksi
-                        }
-                        
                         span.set_attribute("authentication.result", "SUCCESS")
-                        return {
+                        return ORJSONResponse({
                             "status": "AUTHENTICATION_SUCCESS",
-                            "nas_message": security_cmd.dict()
-                        }
+                            "nas_message": security_cmd
+                        })
                 else:
                     span.set_attribute("authentication.result", "FAILURE")
-                    return {
+                    return ORJSONResponse({
                         "status": "AUTHENTICATION_FAILURE",
-                        "cause": FgmmCause.MAC_FAILURE.value
-                    }
+                        "cause": MAC_FAILURE
+                    })
             else:
                 raise HTTPException(status_code=500, detail="AUSF confirmation failed")
                 
         except Exception as e:
             span.set_attribute("error", str(e))
-            logger.error(f"Authentication response processing failed: {e}")
+            logger.error("Authentication response processing failed: %s", e)
             raise HTTPException(status_code=500, detail=f"Authentication response failed: {e}")
 
 @app.post("/nas/security-mode-complete")
@@ -587,37 +822,70 @@ async def process_security_mode_complete(security_data: Dict):
             supi = security_data.get("supi")
             imeisv = security_data.get("imeisv")
             
-            if supi not in ue_contexts:
-                raise HTTPException(status_code=404, detail="UE context not found")
-            
-            # Complete security mode procedure
-            ue_context = ue_contexts[supi]
-            ue_context["security_mode_complete"] = True
-            ue_context["imeisv"] = imeisv
-            
-            # Finalize registration
-            registration_accept = amf_nas_instance.create_registration_accept(
-                supi, ue_context.get("requested_nssai")
-            )
-            
-            ue_context["registration_state"] = "REGISTERED"
-            ue_context["guti"] = registration_accept.mobile_identity
-            
-            span.set_attribute("security_mode.status", "SUCCESS")
-            logger.info(f"Security mode procedure completed for SUPI: {supi}")
-            
-            return {
-                "status": "REGISTRATION_COMPLETE",
-                "nas_message": registration_accept.dict()
-            }
+            async with _lock(supi):
+                ue_context = _shard(supi).get(supi)
+                if ue_context is None:
+                    raise HTTPException(status_code=404, detail="UE context not found")
+                
+                # Complete security mode procedure
+                ue_context.security_mode_complete = True
+                ue_context.imeisv = imeisv
+                
+                # Finalize registration
+                registration_accept = amf_nas_instance.create_registration_accept(
+                    supi, ue_context.requested_nssai
+                )
+                
+                ue_context.registration_state = "REGISTERED"
+                ue_context.guti = registration_accept["mobile_identity"]
+                
+                span.set_attribute("security_mode.status", "SUCCESS")
+                logger.info("Security mode procedure completed for SUPI: %s", supi)
+                
+                return ORJSONResponse({
+                    "status": "REGISTRATION_COMPLETE",
+                    "nas_message": registration_accept
+                })
             
         except Exception as e:
             span.set_attribute("error", str(e))
-            logger.error(f"Security mode complete processing failed: {e}")
+            logger.error("Security mode complete processing failed: %s", e)
             raise HTTPException(status_code=500, detail=f"Security mode complete failed: {e}")
 
+def _pdu_session_view(pdu_session: PduSession) -> Dict:
+    """Client-facing session context; timestamps are formatted as ISO 8601 here"""
+    return {
+        "pdu_session_id": pdu_session.pdu_session_id,
+        "pti": pdu_session.pti,
+        "pdu_session_type": pdu_session.pdu_session_type,
+        "ssc_mode": pdu_session.ssc_mode,
+        "state": pdu_session.state,
+        "created_time": _ns_to_iso(pdu_session.created_time_ns),
+        "smf_context": pdu_session.smf_context
+    }
+
+async def _forward_to_smf(session_id: str, smf_request: Dict):
+    """Create the SM context on SMF and update the PDU session when it replies"""
+    pdu_session = pdu_sessions.get(session_id)
+    if pdu_session is None:
+        return
+    try:
+        response = await amf_nas_instance.http_client.post(f"{smf_url}/nsmf-pdusession/v1/sm-contexts",
+                                                           json=smf_request)
+        if response.status_code in [200, 201]:
+            pdu_session.smf_context = response.json()
+            pdu_session.state = "ACTIVE"
+        else:
+            pdu_session.state = "FAILED"
+            logger.error("SMF rejected SM context creation for session %s: %s",
+                         session_id, response.status_code)
+    except Exception as e:
+        pdu_session.state = "FAILED"
+        logger.error("SMF SM context creation failed for session %s: %s", session_id, e)
+
 @app.post("/nas/pdu-session-establishment-request")
-async def process_pdu_session_establishment_request(pdu_req: PduSessionEstablishmentRequest):
+async def process_pdu_session_establishment_request(pdu_req: PduSessionEstablishmentRequest,
+                                                    background: BackgroundTasks):
     """
     Process PDU Session Establishment Request per 3GPP TS 24.501 § 8.3.1.1
     """
@@ -628,18 +896,17 @@ async def process_pdu_session_establishment_request(pdu_req: PduSessionEstablish
         
         try:
             # Create PDU session context
-            session_id = str(uuid.uuid4())
-            pdu_session = {
-                "pdu_session_id": pdu_req.pdu_session_id,
-                "pti": pdu_req.pti,
-                "pdu_session_type": pdu_req.pdu_session_type,
-                "ssc_mode": pdu_req.ssc_mode,
-                "state": "CREATING",
-                "created_time": datetime.utcnow()
-            }
+            session_id = f"pdu-{next(_session_counter):016x}"
+            pdu_session = PduSession(
+                pdu_session_id=pdu_req.pdu_session_id,
+                pti=pdu_req.pti,
+                pdu_session_type=pdu_req.pdu_session_type,
+                ssc_mode=pdu_req.ssc_mode,
+                created_time_ns=time.time_ns()
+            )
             pdu_sessions[session_id] = pdu_session
             
-            # Forward to SMF for session management
+            # Forward to SMF for session management; the accept does not wait on it
             if smf_url:
                 smf_request = {
                     "pduSessionId": pdu_req.pdu_session_id,
@@ -648,34 +915,28 @@ async def process_pdu_session_establishment_request(pdu_req: PduSessionEstablish
                     "pduSessionType": "IPV4",
                     "sscMode": "SSC_MODE_1"
                 }
+                background.add_task(_forward_to_smf, session_id, smf_request)
                 
-                response = requests.post(f"{smf_url}/nsmf-pdusession/v1/sm-contexts", 
-                                       json=smf_request)
-                
-                if response.status_code in [200, 201]:
-                    pdu_session["state"] = "ACTIVE"
-                    pdu_session["smf_context"] = response.json()
-                    
-                    span.set_attribute("pdu_session.status", "SUCCESS")
-                    return {
-                        "status": "PDU_SESSION_ESTABLISHMENT_ACCEPT",
-                        "pdu_session_id": pdu_req.pdu_session_id,
-                        "session_context": pdu_session
-                    }
+                span.set_attribute("pdu_session.status", "SUCCESS")
+                return ORJSONResponse({
+                    "status": "PDU_SESSION_ESTABLISHMENT_ACCEPT",
+                    "pdu_session_id": pdu_req.pdu_session_id,
+                    "session_context": _pdu_session_view(pdu_session)
+                })
             
             # Fallback - local processing
-            pdu_session["state"] = "ACTIVE"
+            pdu_session.state = "ACTIVE"
             span.set_attribute("pdu_session.status", "SUCCESS")
             
-            return {
+            return ORJSONResponse({
                 "status": "PDU_SESSION_ESTABLISHMENT_ACCEPT",
                 "pdu_session_id": pdu_req.pdu_session_id,
                 "allocated_ip": "192.168.1.100"
-            }
+            })
             
         except Exception as e:
             span.set_attribute("error", str(e))
-            logger.error(f"PDU session establishment failed: {e}")
+            logger.error("PDU session establishment failed: %s", e)
             raise HTTPException(status_code=500, detail=f"PDU session establishment failed: {e}")
 
 # Status and monitoring endpoints
@@ -684,7 +945,7 @@ async def amf_nas_status():
     """Get AMF-NAS status"""
     return {
         "status": "operational",
-        "registered_ues": len(ue_contexts),
+        "registered_ues": _ue_count(),
         "active_pdu_sessions": len(pdu_sessions),
         "security_contexts": len(nas_security_contexts),
         "guami": amf_nas_instance.guami,
@@ -693,21 +954,23 @@ async def amf_nas_status():
 
 @app.get("/amf-nas/ue-contexts")
 async def get_ue_contexts():
-    """Get all UE contexts"""
-    return {
-        "total_ues": len(ue_contexts),
-        "ue_contexts": {
-            supi: {
-                "supi": ctx["supi"],
-                "registration_state": ctx["registration_state"],
-                "guti": ctx.get("guti"),
-                "allowed_nssai": ctx.get("allowed_nssai"),
-                "pdu_sessions": len(ctx.get("pdu_sessions", {})),
-                "registration_time": ctx["registration_time"].isoformat()
-            }
-            for supi, ctx in ue_contexts.items()
-        }
-    }
+    """Get all UE contexts, streamed one entry at a time"""
+    async def _stream():
+        yield b'{"total_ues":%d,"ue_contexts":{' % _ue_count()
+        sep = b""
+        for supi, ctx in _iter_ue_contexts():
+            yield sep + orjson.dumps(supi) + b":" + orjson.dumps({
+                "supi": ctx.supi,
+                "registration_state": ctx.registration_state,
+                "guti": ctx.guti,
+                "allowed_nssai": ctx.allowed_nssai,
+                "pdu_sessions": len(ctx.pdu_sessions),
+                "registration_time": _ns_to_iso(ctx.registration_time_ns)
+            })
+            sep = b","
+        yield b"}}"
+    
+    return StreamingResponse(_stream(), media_type="application/json")
 
 @app.get("/health")
 def health_check():
@@ -717,8 +980,8 @@ def health_check():
         "service": "AMF-NAS",
         "compliance": "3GPP TS 24.501, TS 23.502",
         "version": "1.0.0",
-        "registered_ues": len(ue_contexts)
+        "registered_ues": _ue_count()
     }
 
 if __name__ == "__main__":
-    uvicorn.run(app, host="127.0.0.1", port=9001)
\ No newline at end of file
+    uvicorn.run(app, host="127.0.0.1", port=9001, loop="auto", http="httptools")
\ No newline at end of file
@@ -3,17 +3,31 @@
 # 3GPP TS 33.501 - 5G Authentication and Key Agreement (5G-AKA) Implementation
 
 from fastapi import FastAPI, HTTPException, Request
+from fastapi.exceptions import RequestValidationError
+from fastapi.responses import ORJSONResponse
 from pydantic import BaseModel
+from pydantic.error_wrappers import ErrorWrapper
+from pydantic.errors import MissingError
 from typing import Dict, List, Optional
 import uvicorn
-import requests
+import asyncio
+import httpx
+import orjson
 import uuid
 import hashlib
-import secrets
+import hmac
+import os
+import base64
+import binascii
 import json
 import logging
-from datetime import datetime, timedelta
+import ssl
+import re
+import time
+from datetime import datetime, timezone
 from contextlib import asynccontextmanager
+from dataclasses import dataclass
+from functools import lru_cache
 from opentelemetry import trace
 
 # Configure logging
@@ -26,6 +40,71 @@ tracer = trace.get_tracer(__name__)
 nrf_url = "http://127.0.0.1:8000"
 udm_url = "http://127.0.0.1:9004"
 
+# Shared keep-alive HTTP client for N13 (UDM) and NRF calls, managed by lifespan
+ausf_http: Optional[httpx.AsyncClient] = None
+_JSON_HEADERS = {"content-type": "application/json"}
+_NRF_OK = frozenset({200, 201})
+
+# Constant span attributes per procedure
+_AUTH_REQ_ATTRS = {
+    "3gpp.procedure": "5g_aka_authentication",
+    "3gpp.interface": "N12",
+    "3gpp.service": "Nausf_UEAuthentication"
+}
+_AUTH_CONFIRM_ATTRS = {
+    "3gpp.procedure": "5g_aka_confirmation",
+    "3gpp.interface": "N12"
+}
+
+_CONFIRMATION_HREF = "/nausf-auth/v1/ue-authentications/{}/5g-aka-confirmation"
+_AUTH_FAILURE_RESPONSE = {
+    "authResult": "AUTHENTICATION_FAILURE",
+    "supi": None,
+    "kseaf": None,
+    "authenticationVector": None
+}
+
+# Key derivation: hashlib.sha256 is OpenSSL-backed (SHA-NI where the CPU has it)
+_SHA256 = hashlib.sha256
+_KAUSF = b"KAUSF"
+_KSEAF = b"KSEAF"
+_AMF_FIELD = b"\x80\x00"  # AUTN Management Field
+
+# SUCI -> last scheme-output field; same result as "imsi-" + suci.split("-")[-1]
+_SUCI_RE = re.compile(r"suci-(?:.*-)?([^-]*)\Z", re.DOTALL)
+
+def _normalize_supi(supi_or_suci: str) -> str:
+    """Map a SUCI to its SUPI (simplified: no de-concealment); SUPIs pass through"""
+    m = _SUCI_RE.match(supi_or_suci)
+    return f"imsi-{m.group(1)}" if m else supi_or_suci
+
+@lru_cache(maxsize=256)
+def _kseaf_suffix(serving_network_name: str) -> bytes:
+    """Encoded '<serving network name>KSEAF' - only a handful of SNNs exist"""
+    return serving_network_name.encode() + _KSEAF
+
+class _RandPool:
+    """os.urandom (the secrets source) drawn in 4 KiB blocks and handed out in slices"""
+    __slots__ = ("buf", "off")
+    
+    def __init__(self, block: int = 4096):
+        self.buf = os.urandom(block)
+        self.off = 0
+    
+    def take(self, n: int) -> bytes:
+        if self.off + n > len(self.buf):
+            self.buf = os.urandom(max(4096, n))
+            self.off = 0
+        chunk = self.buf[self.off:self.off + n]
+        self.off += n
+        return chunk
+
+_POOL = _RandPool()
+
+def _new_ctx_id() -> str:
+    """128-bit random authCtxId as 22 URL-safe base64 chars (no UUID formatting)"""
+    return base64.urlsafe_b64encode(_POOL.take(16))[:22].decode("ascii")
+
 # 3GPP TS 29.509 - Data Models
 class PlmnId(BaseModel):
     mcc: str  # Mobile Country Code
@@ -63,13 +142,148 @@ class ConfirmationDataResponse(BaseModel):
     authenticationVector: Optional[AuthenticationVector] = None
 
 # AUSF Authentication Context Storage
-authentication_contexts: Dict[str, Dict] = {}
+AUTH_ONGOING = 0
+AUTH_SUCCESS = 1
+AUTH_FAILURE = 2
+_AUTH_STATUS_NAMES = ("ONGOING", "SUCCESS", "FAILURE")
+
+# Context retention: hard cap plus TTLs enforced by the background reaper
+AUTH_CTX_MAX = 100_000
+AUTH_CTX_TTL_ONGOING_NS = 60 * 1_000_000_000
+AUTH_CTX_TTL_COMPLETED_NS = 300 * 1_000_000_000
+AUTH_CTX_REAP_INTERVAL = 5.0
+AUTH_CTX_SHARDS = 16
+
+def _ns_to_iso(ns: int) -> str:
+    """Format a time.time_ns() timestamp as ISO 8601 (UTC)"""
+    return datetime.fromtimestamp(ns / 1e9, tz=timezone.utc).isoformat()
+
+@dataclass(slots=True)
+class AuthCtx:
+    supi: str
+    serving_network_name: str
+    auth_type: str
+    rand: str
+    autn: str
+    hxresstar: str
+    kausf: str
+    timestamp_ns: int
+    status: int = AUTH_ONGOING
+    completed_at_ns: int = 0
+    kseaf: Optional[str] = None
+
+class AuthContextStore:
+    """
+    Authentication contexts keyed by authCtxId, partitioned into shards.
+    Per-status counts are updated on every transition so metrics are O(1).
+    """
+    def __init__(self, max_size: int = AUTH_CTX_MAX, shards: int = AUTH_CTX_SHARDS):
+        self.max_size = max_size
+        self.shard_max = max(1, max_size // shards)
+        self._mask = shards - 1
+        # Each shard is insertion-ordered, so its first key is its oldest context.
+        # This holds because contexts are stored once, under a fresh authCtxId,
+        # with timestamp_ns taken at creation.
+        self.shards: List[Dict[str, AuthCtx]] = [{} for _ in range(shards)]
+        # Expiry queues per shard: ongoing ids in creation order, completed ids in
+        # completion order, so the reaper stops at the first unexpired entry of each
+        self._ongoing: List[Dict[str, None]] = [{} for _ in range(shards)]
+        self._completed: List[Dict[str, None]] = [{} for _ in range(shards)]
+        self.counts = [0] * len(_AUTH_STATUS_NAMES)
+    
+    def _index(self, ctx_id: str) -> int:
+        # str caches its hash, so this costs nothing beyond the dict lookup
+        return hash(ctx_id) & self._mask
+    
+    def _shard(self, ctx_id: str) -> Dict[str, AuthCtx]:
+        return self.shards[self._index(ctx_id)]
+    
+    def _evict(self, index: int, ctx_id: str):
+        self.counts[self.shards[index].pop(ctx_id).status] -= 1
+        self._ongoing[index].pop(ctx_id, None)
+        self._completed[index].pop(ctx_id, None)
+    
+    def __len__(self) -> int:
+        return sum(map(len, self.shards))
+    
+    def __contains__(self, ctx_id: str) -> bool:
+        return ctx_id in self._shard(ctx_id)
+    
+    def __getitem__(self, ctx_id: str) -> AuthCtx:
+        return self._shard(ctx_id)[ctx_id]
+    
+    def __setitem__(self, ctx_id: str, context: AuthCtx):
+        index = self._index(ctx_id)
+        shard = self.shards[index]
+        if ctx_id in shard:
+            self._evict(index, ctx_id)
+        elif len(shard) >= self.shard_max:
+            self._evict(index, next(iter(shard)))
+        shard[ctx_id] = context
+        self.counts[context.status] += 1
+        queue = self._ongoing if context.status == AUTH_ONGOING else self._completed
+        queue[index][ctx_id] = None
+    
+    def __delitem__(self, ctx_id: str):
+        self._evict(self._index(ctx_id), ctx_id)
+    
+    def complete(self, ctx_id: str, status: int, now_ns: int) -> AuthCtx:
+        """Record the outcome of an ongoing context and move it to the completed queue"""
+        index = self._index(ctx_id)
+        context = self.shards[index][ctx_id]
+        self.counts[context.status] -= 1
+        context.status = status
+        context.completed_at_ns = now_ns
+        self.counts[status] += 1
+        self._ongoing[index].pop(ctx_id, None)
+        completed = self._completed[index]
+        completed.pop(ctx_id, None)
+        completed[ctx_id] = None
+        return context
+    
+    def count(self, status: int) -> int:
+        return self.counts[status]
+    
+    def reap(self, now_ns: int) -> int:
+        """
+        Evict expired contexts; returns the number evicted. Ongoing contexts expire
+        AUTH_CTX_TTL_ONGOING_NS after creation, completed ones AUTH_CTX_TTL_COMPLETED_NS
+        after completion. Each queue is scanned only up to its first unexpired entry.
+        """
+        ongoing_cutoff = now_ns - AUTH_CTX_TTL_ONGOING_NS
+        completed_cutoff = now_ns - AUTH_CTX_TTL_COMPLETED_NS
+        evicted = 0
+        for index, shard in enumerate(self.shards):
+            expired = []
+            for ctx_id in self._ongoing[index]:
+                if shard[ctx_id].timestamp_ns >= ongoing_cutoff:
+                    break
+                expired.append(ctx_id)
+            for ctx_id in self._completed[index]:
+                if shard[ctx_id].completed_at_ns >= completed_cutoff:
+                    break
+                expired.append(ctx_id)
+            for ctx_id in expired:
+                self._evict(index, ctx_id)
+            evicted += len(expired)
+        return evicted
+
+authentication_contexts = AuthContextStore()
+
+async def _reap_authentication_contexts():
+    while True:
+        await asyncio.sleep(AUTH_CTX_REAP_INTERVAL)
+        evicted = authentication_contexts.reap(time.time_ns())
+        if evicted:
+            logger.debug(f"Reaped {evicted} expired authentication contexts")
 
 class AUSF:
     def __init__(self):
         self.name = "AUSF-001"
         self.nf_instance_id = str(uuid.uuid4())
         self.supported_auth_types = ["5G_AKA", "EAP_AKA_PRIME"]
+        # NF profile JSON, serialized once at startup and reused for (re-)registration
+        self.nf_profile_body: Optional[bytes] = None
         
     async def get_authentication_vectors_from_udm(self, supi: str, serving_network_name: str):
         """
@@ -83,8 +297,8 @@ class AUSF:
                 "ausfInstanceId": self.nf_instance_id
             }
             
-            response = requests.post(f"{udm_url}/nudm-ueau/v1/{supi}/security-information/generate-auth-data", 
-                                   json=udm_request)
+            response = await ausf_http.post(f"{udm_url}/nudm-ueau/v1/{supi}/security-information/generate-auth-data",
+                                            content=orjson.dumps(udm_request), headers=_JSON_HEADERS)
             
             if response.status_code == 200:
                 return response.json()
@@ -101,35 +315,47 @@ class AUSF:
         Generate 5G-AKA authentication vectors per TS 33.501
         This is a simplified implementation for simulation purposes
         """
+        supi_b = supi.encode()
+        
+        # One 36-byte draw per UE: RAND(16) | SQN(6) | AK(6) | MAC(8)
+        raw = _POOL.take(36)
+        
         # Generate random challenge (RAND) - 16 bytes
-        rand = secrets.token_hex(16)
+        rand_b = raw[:16]
         
         # Generate authentication token (AUTN) - 16 bytes
         # AUTN = SQN ⊕ AK || AMF || MAC
-        sqn = secrets.token_hex(6)
-        ak = secrets.token_hex(6)
-        amf = "8000"  # Management Field
-        mac = secrets.token_hex(8)
-        autn = sqn + amf + mac
+        sqn_b = raw[16:22]
+        ak_b = raw[22:28]
+        mac_b = raw[28:36]
+        autn_b = sqn_b + _AMF_FIELD + mac_b
+        
+        # Both derivations start with SUPI || RAND: hash that prefix once
+        prefix = _SHA256(supi_b)
+        prefix.update(rand_b)
+        kausf_h = prefix.copy()
         
         # Generate expected response (HXRES*)
-        hxresstar = hashlib.sha256((supi + rand + autn).encode()).hexdigest()[:16]
+        prefix.update(autn_b)
+        hxresstar_b = prefix.digest()[:8]
         
         # Generate KAUSF (Authentication Server Function Key)
-        kausf = hashlib.sha256((supi + rand + "KAUSF").encode()).hexdigest()
+        kausf_h.update(_KAUSF)
         
+        # Hex only at the boundary, in one call: RAND(32) | AUTN(32) | HXRES*(16) | KAUSF(64)
+        hex_all = binascii.hexlify(rand_b + autn_b + hxresstar_b + kausf_h.digest()).decode("ascii")
         return {
-            "rand": rand,
-            "autn": autn,
-            "hxresstar": hxresstar,
-            "kausf": kausf
+            "rand": hex_all[:32],
+            "autn": hex_all[32:64],
+            "hxresstar": hex_all[64:80],
+            "kausf": hex_all[80:]
         }
     
     def derive_kseaf(self, kausf: str, serving_network_name: str):
         """
         Derive KSEAF (Security Anchor Function Key) per TS 33.501
         """
-        return hashlib.sha256((kausf + serving_network_name + "KSEAF").encode()).hexdigest()
+        return _SHA256(kausf.encode() + _kseaf_suffix(serving_network_name)).hexdigest()
     
     def verify_authentication_response(self, auth_ctx_id: str, res_star: str):
         """
@@ -138,18 +364,25 @@ class AUSF:
         if auth_ctx_id not in authentication_contexts:
             return False
             
-        context = authentication_contexts[auth_ctx_id]
-        expected_hxres = context.get("hxresstar")
+        expected_hxres = authentication_contexts[auth_ctx_id].hxresstar
         
         # In real implementation, RES* would be derived from RES
-        # For simulation, we compare directly with HXRES*
-        return res_star == expected_hxres
+        # For simulation, we compare directly with HXRES* (constant-time)
+        return hmac.compare_digest(res_star.encode(), expected_hxres.encode())
 
 ausf_instance = AUSF()
 
 @asynccontextmanager
 async def lifespan(app: FastAPI):
     # Startup - Register with NRF per TS 29.510
+    global ausf_http
+    ausf_http = httpx.AsyncClient(
+        timeout=2.0,
+        limits=httpx.Limits(max_keepalive_connections=64)
+    )
+    
+    logger.info(f"5G-AKA key derivation via hashlib on {ssl.OPENSSL_VERSION}")
+    
     nf_profile = {
         "nfInstanceId": ausf_instance.nf_instance_id,
         "nfType": "AUSF",
@@ -173,29 +406,38 @@ async def lifespan(app: FastAPI):
         }
     }
     
+    ausf_instance.nf_profile_body = orjson.dumps(nf_profile)
+    
     try:
-        response = requests.post(f"{nrf_url}/nnrf-nfm/v1/nf-instances/{ausf_instance.nf_instance_id}", 
-                               json=nf_profile)
-        if response.status_code in [200, 201]:
+        response = await ausf_http.put(f"{nrf_url}/nnrf-nfm/v1/nf-instances/{ausf_instance.nf_instance_id}",
+                                       content=ausf_instance.nf_profile_body, headers=_JSON_HEADERS)
+        if response.status_code in _NRF_OK:
             logger.info("AUSF registered with NRF successfully")
         else:
             logger.warning(f"AUSF registration with NRF failed: {response.status_code}")
-    except requests.RequestException as e:
+    except httpx.HTTPError as e:
         logger.error(f"Failed to register AUSF with NRF: {e}")
     
+    reaper = asyncio.create_task(_reap_authentication_contexts())
+    
     yield
     
     # Shutdown
+    reaper.cancel()
     try:
-        requests.delete(f"{nrf_url}/nnrf-nfm/v1/nf-instances/{ausf_instance.nf_instance_id}")
+        await ausf_http.delete(f"{nrf_url}/nnrf-nfm/v1/nf-instances/{ausf_instance.nf_instance_id}")
         logger.info("AUSF deregistered from NRF")
     except:
         pass
+    finally:
+        await ausf_http.aclose()
+        ausf_http = None
 
 app = FastAPI(
     title="AUSF - Authentication Server Function",
     description="3GPP TS 29.509 compliant AUSF implementation with 5G-AKA support",
     version="1.0.0",
+    default_response_class=ORJSONResponse,
     lifespan=lifespan
 )
 
@@ -207,19 +449,16 @@ async def ue_authentication_request(auth_request: AuthenticationRequest):
     Implements 5G-AKA procedure per TS 33.501
     """
     with tracer.start_as_current_span("ausf_ue_authentication_request") as span:
-        span.set_attribute("3gpp.procedure", "5g_aka_authentication")
-        span.set_attribute("3gpp.interface", "N12")
-        span.set_attribute("3gpp.service", "Nausf_UEAuthentication") 
-        span.set_attribute("ue.supi_or_suci", auth_request.supiOrSuci)
-        span.set_attribute("serving_network", auth_request.servingNetworkName)
+        span.set_attributes({
+            **_AUTH_REQ_ATTRS,
+            "ue.supi_or_suci": auth_request.supiOrSuci,
+            "serving_network": auth_request.servingNetworkName
+        })
         
         try:
             # Extract SUPI from SUCI if needed (simplified for simulation)
-            supi = auth_request.supiOrSuci
-            if supi.startswith("suci-"):
-                # In real implementation, would decrypt SUCI to get SUPI
-                # For simulation, convert suci-001-01-xxxx to imsi-xxxx
-                supi = "imsi-" + supi.split("-")[-1]
+            # In real implementation, would decrypt SUCI to get SUPI
+            supi = _normalize_supi(auth_request.supiOrSuci)
             
             # Get authentication vectors from UDM via N13
             udm_auth_data = await ausf_instance.get_authentication_vectors_from_udm(
@@ -234,41 +473,37 @@ async def ue_authentication_request(auth_request: AuthenticationRequest):
                 auth_vectors = udm_auth_data.get("authenticationVector", {})
             
             # Create authentication context
-            auth_ctx_id = str(uuid.uuid4())
-            authentication_contexts[auth_ctx_id] = {
-                "supi": supi,
-                "servingNetworkName": auth_request.servingNetworkName,
-                "authType": "5G_AKA",
-                "rand": auth_vectors["rand"],
-                "autn": auth_vectors["autn"],
-                "hxresstar": auth_vectors["hxresstar"],
-                "kausf": auth_vectors["kausf"],
-                "timestamp": datetime.utcnow(),
-                "status": "ONGOING"
-            }
-            
-            # Prepare authentication challenge response
-            auth_info_result = AuthenticationInfoResult(
-                authType="5G_AKA",
-                authenticationVector=AuthenticationVector(
-                    rand=auth_vectors["rand"],
-                    autn=auth_vectors["autn"],
-                    hxresstar=auth_vectors["hxresstar"],
-                    kausf=auth_vectors["kausf"]
-                ),
+            auth_ctx_id = _new_ctx_id()
+            authentication_contexts[auth_ctx_id] = AuthCtx(
                 supi=supi,
-                _links={
-                    "5g-aka": {
-                        "href": f"/nausf-auth/v1/ue-authentications/{auth_ctx_id}/5g-aka-confirmation"
-                    }
-                }
+                serving_network_name=auth_request.servingNetworkName,
+                auth_type="5G_AKA",
+                rand=auth_vectors["rand"],
+                autn=auth_vectors["autn"],
+                hxresstar=auth_vectors["hxresstar"],
+                kausf=auth_vectors["kausf"],
+                timestamp_ns=time.time_ns()
             )
             
-            span.set_attribute("auth_context_id", auth_ctx_id)
-            span.set_attribute("response.status", "SUCCESS")
+            # Prepare authentication challenge response (AuthenticationInfoResult)
+            auth_info_result = {
+                "authType": "5G_AKA",
+                "authenticationVector": {
+                    "rand": auth_vectors["rand"],
+                    "autn": auth_vectors["autn"],
+                    "hxresstar": auth_vectors["hxresstar"],
+                    "kausf": auth_vectors["kausf"]
+                },
+                "supi": supi,
+                "_links": {
+                    "5g-aka": {"href": _CONFIRMATION_HREF.format(auth_ctx_id)}
+                }
+            }
+            
+            span.set_attributes({"auth_context_id": auth_ctx_id, "response.status": "SUCCESS"})
             
             logger.info(f"5G-AKA authentication challenge sent for SUPI: {supi}")
-            return auth_info_result
+            return ORJSONResponse(auth_info_result)
             
         except Exception as e:
             span.set_attribute("error", str(e))
@@ -277,15 +512,34 @@ async def ue_authentication_request(auth_request: AuthenticationRequest):
 
 # 3GPP TS 29.509 § 5.2.2.2.2 - 5G-AKA Confirmation
 @app.put("/nausf-auth/v1/ue-authentications/{authCtxId}/5g-aka-confirmation", 
-         response_model=ConfirmationDataResponse)
-async def authentication_confirmation(authCtxId: str, confirmation: ConfirmationData):
+         response_model=ConfirmationDataResponse,
+         openapi_extra={"requestBody": {
+             "required": True,
+             "content": {"application/json": {"schema": ConfirmationData.schema()}}
+         }})
+async def authentication_confirmation(authCtxId: str, request: Request):
     """
     Handle 5G-AKA authentication confirmation per 3GPP TS 29.509
     """
+    # ConfirmationData has a single field; parse it straight from the raw body,
+    # failing the way FastAPI body parsing does
+    raw = await request.body()
+    if not raw:
+        raise RequestValidationError([ErrorWrapper(MissingError(), loc=("body",))])
+    try:
+        data = orjson.loads(raw)
+    except orjson.JSONDecodeError as e:
+        raise RequestValidationError([ErrorWrapper(e, loc=("body", e.pos))])
+    res_star = data.get("resStar") if isinstance(data, dict) else None
+    if not isinstance(res_star, str):
+        # Off the fast path the model coerces or reports the error
+        try:
+            res_star = ConfirmationData.validate(data).resStar
+        except (TypeError, ValueError) as e:
+            raise RequestValidationError([ErrorWrapper(e, loc=("body",))])
+    
     with tracer.start_as_current_span("ausf_5g_aka_confirmation") as span:
-        span.set_attribute("3gpp.procedure", "5g_aka_confirmation")
-        span.set_attribute("3gpp.interface", "N12")
-        span.set_attribute("auth_context_id", authCtxId)
+        span.set_attributes({**_AUTH_CONFIRM_ATTRS, "auth_context_id": authCtxId})
         
         try:
             if authCtxId not in authentication_contexts:
@@ -295,47 +549,41 @@ async def authentication_confirmation(authCtxId: str, confirmation: Confirmation
             context = authentication_contexts[authCtxId]
             
             # Verify authentication response
-            is_valid = ausf_instance.verify_authentication_response(authCtxId, confirmation.resStar)
+            is_valid = ausf_instance.verify_authentication_response(authCtxId, res_star)
             
             if is_valid:
                 # Authentication successful
-                kseaf = ausf_instance.derive_kseaf(context["kausf"], context["servingNetworkName"])
+                kseaf = ausf_instance.derive_kseaf(context.kausf, context.serving_network_name)
                 
                 # Update context
-                context["status"] = "SUCCESS"
-                context["kseaf"] = kseaf
-                context["completedAt"] = datetime.utcnow()
+                authentication_contexts.complete(authCtxId, AUTH_SUCCESS, time.time_ns())
+                context.kseaf = kseaf
                 
-                response = ConfirmationDataResponse(
-                    authResult="AUTHENTICATION_SUCCESS",
-                    supi=context["supi"],
-                    kseaf=kseaf,
-                    authenticationVector=AuthenticationVector(
-                        rand=context["rand"],
-                        autn=context["autn"],
-                        hxresstar=context["hxresstar"],
-                        kausf=context["kausf"]
-                    )
-                )
+                response = {
+                    "authResult": "AUTHENTICATION_SUCCESS",
+                    "supi": context.supi,
+                    "kseaf": kseaf,
+                    "authenticationVector": {
+                        "rand": context.rand,
+                        "autn": context.autn,
+                        "hxresstar": context.hxresstar,
+                        "kausf": context.kausf
+                    }
+                }
                 
                 span.set_attribute("auth_result", "SUCCESS")
-                logger.info(f"5G-AKA authentication successful for SUPI: {context['supi']}")
+                logger.info(f"5G-AKA authentication successful for SUPI: {context.supi}")
                 
-                return response
+                return ORJSONResponse(response)
                 
             else:
                 # Authentication failed
-                context["status"] = "FAILURE"
-                context["completedAt"] = datetime.utcnow()
-                
-                response = ConfirmationDataResponse(
-                    authResult="AUTHENTICATION_FAILURE"
-                )
+                authentication_contexts.complete(authCtxId, AUTH_FAILURE, time.time_ns())
                 
                 span.set_attribute("auth_result", "FAILURE")
-                logger.warning(f"5G-AKA authentication failed for SUPI: {context['supi']}")
+                logger.warning(f"5G-AKA authentication failed for SUPI: {context.supi}")
                 
-                return response
+                return ORJSONResponse(_AUTH_FAILURE_RESPONSE)
                 
         except HTTPException:
             raise
@@ -365,10 +613,10 @@ async def get_authentication_context(authCtxId: str):
     context = authentication_contexts[authCtxId]
     return {
         "authCtxId": authCtxId,
-        "authType": context["authType"],
-        "status": context["status"],
-        "supi": context["supi"],
-        "timestamp": context["timestamp"].isoformat()
+        "authType": context.auth_type,
+        "status": _AUTH_STATUS_NAMES[context.status],
+        "supi": context.supi,
+        "timestamp": _ns_to_iso(context.timestamp_ns)
     }
 
 # Delete authentication context
@@ -397,8 +645,8 @@ def health_check():
 def get_metrics():
     """Metrics endpoint for monitoring"""
     total_contexts = len(authentication_contexts)
-    successful_auths = sum(1 for ctx in authentication_contexts.values() if ctx.get("status") == "SUCCESS")
-    failed_auths = sum(1 for ctx in authentication_contexts.values() if ctx.get("status") == "FAILURE")
+    successful_auths = authentication_contexts.count(AUTH_SUCCESS)
+    failed_auths = authentication_contexts.count(AUTH_FAILURE)
     
     return {
         "total_authentication_contexts": total_contexts,
@@ -408,4 +656,4 @@ def get_metrics():
     }
 
 if __name__ == "__main__":
-    uvicorn.run(app, host="127.0.0.1", port=9003)
\ No newline at end of file
+    uvicorn.run(app, host="127.0.0.1", port=9003, loop="auto", http="httptools")
\ No newline at end of file
@@ -5,26 +5,41 @@
 from fastapi import FastAPI, HTTPException, Depends, Security, status, Query, Path, Header
 from fastapi.security import HTTPBearer, HTTPAuthorizationCredentials, OAuth2PasswordBearer
 from fastapi.middleware.cors import CORSMiddleware
-from pydantic import BaseModel, Field, validator
-from typing import Dict, List, Optional, Any, Union
+from fastapi.responses import ORJSONResponse, Response
+from pydantic import BaseModel, Field, constr, validator
+from typing import Dict, List, Optional, Any, Union, Set, Tuple, FrozenSet
+from dataclasses import dataclass, field
+from operator import attrgetter
+from functools import lru_cache
 import uvicorn
 import uuid
 import hashlib
+import hmac
+import base64
 import secrets
-import json
 import logging
-import jwt
+import os
+import asyncio
+import time
+import itertools
+import heapq
+import orjson
 from datetime import datetime, timedelta
 from opentelemetry import trace
 from enum import Enum
+from contextlib import asynccontextmanager
 
 # Configure logging
-logging.basicConfig(level=logging.INFO)
+logging.basicConfig(level=os.environ.get("NRF_LOG_LEVEL", "INFO").upper())
 logger = logging.getLogger(__name__)
 
 # OpenTelemetry tracer
 tracer = trace.get_tracer(__name__)
 
+# Constant span attributes per operation
+_REGISTER_SPAN_ATTRS = {"3gpp.service": "Nnrf_NFManagement", "3gpp.operation": "RegisterNFInstance"}
+_SEARCH_SPAN_ATTRS = {"3gpp.service": "Nnrf_NFDiscovery", "3gpp.operation": "SearchNFInstances"}
+
 # OAuth2 Configuration
 oauth2_scheme = OAuth2PasswordBearer(tokenUrl="oauth2/token")
 security = HTTPBearer()
@@ -33,6 +48,53 @@ security = HTTPBearer()
 JWT_SECRET_KEY = secrets.token_urlsafe(32)
 JWT_ALGORITHM = "HS256"
 JWT_ACCESS_TOKEN_EXPIRE_MINUTES = 60
+JWT_AUDIENCE = "nrf"
+JWT_DEFAULT_SCOPE = "nnrf-nfm nnrf-disc"
+# Discovery responses are cached per ETag for a few seconds
+DISCOVERY_CACHE_MAX = 1024
+DISCOVERY_CACHE_TTL = 5.0
+
+# The /metrics body is rebuilt off the request path at this cadence
+METRICS_REFRESH_INTERVAL = 1.0
+
+# Issued-token records are kept only until expiry, and never more than this many
+ACCESS_TOKENS_MAX = 10_000
+
+# HS256 is fixed, so the key bytes and encoded header are computed once
+_JWT_KEY = JWT_SECRET_KEY.encode()
+
+def _b64url(data: bytes) -> bytes:
+    return base64.urlsafe_b64encode(data).rstrip(b"=")
+
+def _b64url_decode(data: bytes) -> bytes:
+    return base64.urlsafe_b64decode(data + b"=" * (-len(data) % 4))
+
+_JWT_HEADER_B64 = _b64url(orjson.dumps({"alg": JWT_ALGORITHM, "typ": "JWT"}))
+
+def _jwt_sign(payload: Dict) -> str:
+    """Encode and sign a JWT (HS256) - header.payload.signature"""
+    signing_input = _JWT_HEADER_B64 + b"." + _b64url(orjson.dumps(payload))
+    signature = hmac.new(_JWT_KEY, signing_input, hashlib.sha256).digest()
+    return (signing_input + b"." + _b64url(signature)).decode("ascii")
+
+def _jwt_verify(token: str) -> Optional[Dict]:
+    """Check an HS256 signature in constant time and return the claims, or None"""
+    try:
+        signing_input, _, signature = token.encode("ascii").rpartition(b".")
+        header, _, body = signing_input.partition(b".")
+        if header != _JWT_HEADER_B64:
+            return None
+        expected = _b64url(hmac.new(_JWT_KEY, signing_input, hashlib.sha256).digest())
+        if not hmac.compare_digest(signature, expected):
+            return None
+        payload = orjson.loads(_b64url_decode(body))
+    except ValueError:
+        return None
+    return payload if isinstance(payload, dict) else None
+
+# Verified-token cache: repeat bearers skip the HMAC and JSON decode
+JWT_CACHE_MAX = 10_000
+JWT_CACHE_TTL = 30
 
 # 3GPP TS 29.510 Data Models
 class NFType(str, Enum):
@@ -65,24 +127,57 @@ class NFServiceStatus(str, Enum):
     UNDISCOVERABLE = "UNDISCOVERABLE"
     SUSPENDED = "SUSPENDED"
 
+_HEX_DIGITS = frozenset("0123456789abcdefABCDEF")
+
 class PlmnId(BaseModel):
-    mcc: str = Field(..., regex="^[0-9]{3}$", description="Mobile Country Code")
-    mnc: str = Field(..., regex="^[0-9]{2,3}$", description="Mobile Network Code")
+    mcc: str = Field(..., description="Mobile Country Code")
+    mnc: str = Field(..., description="Mobile Network Code")
+    
+    class Config:
+        frozen = True
+    
+    # Plain character checks instead of a regex match per field
+    @validator("mcc")
+    def _check_mcc(cls, v):
+        if not (len(v) == 3 and v.isascii() and v.isdigit()):
+            raise ValueError("mcc must be 3 digits")
+        return v
+    
+    @validator("mnc")
+    def _check_mnc(cls, v):
+        if not (len(v) in (2, 3) and v.isascii() and v.isdigit()):
+            raise ValueError("mnc must be 2 or 3 digits")
+        return v
 
 class Snssai(BaseModel):
     sst: int = Field(..., ge=0, le=255, description="Slice/Service Type")
-    sd: Optional[str] = Field(None, regex="^[A-Fa-f0-9]{6}$", description="Slice Differentiator")
+    sd: Optional[str] = Field(None, description="Slice Differentiator")
+    
+    class Config:
+        frozen = True
+    
+    @validator("sd")
+    def _check_sd(cls, v):
+        if v is not None and not (len(v) == 6 and _HEX_DIGITS.issuperset(v)):
+            raise ValueError("sd must be 6 hex digits")
+        return v
 
 class IpEndPoint(BaseModel):
     ipv4Address: Optional[str] = Field(None, description="IPv4 address")
     ipv6Address: Optional[str] = Field(None, description="IPv6 address")
     transport: Optional[str] = Field("TCP", description="Transport protocol")
     port: Optional[int] = Field(None, ge=1, le=65535, description="Port number")
+    
+    class Config:
+        frozen = True
 
 class NFServiceVersion(BaseModel):
     apiVersionInUri: str = Field(..., description="API version in URI")
     apiFullVersion: Optional[str] = Field(None, description="Full API version")
     expiry: Optional[datetime] = Field(None, description="Expiry time")
+    
+    class Config:
+        frozen = True
 
 class NFService(BaseModel):
     serviceInstanceId: str = Field(..., description="Service instance identifier")
@@ -103,6 +198,10 @@ class NFService(BaseModel):
     supportedFeatures: Optional[str] = Field(None, description="Supported features")
     chfServiceInfo: Optional[Dict] = Field(None, description="CHF service info")
     defaultNotificationSubscriptions: Optional[List[Dict]] = Field(None, description="Default notification subscriptions")
+    
+    # Legacy discovery views are derived from the first service at registration
+    class Config:
+        frozen = True
 
 class AusfInfo(BaseModel):
     groupId: Optional[str] = Field(None, description="Group identifier")
@@ -236,131 +335,309 @@ class TokenRequest(BaseModel):
     grant_type: str = "client_credentials"
     scope: Optional[str] = None
 
+# Legacy registration payload
+class LegacyRegistration(BaseModel):
+    nf_type: NFType = NFType.AMF
+    ip: str = "127.0.0.1"
+    port: int = Field(8080, ge=1, le=65535)
+
 # NRF Storage
-nf_profiles: Dict[str, NFProfile] = {}
-nf_subscriptions: Dict[str, SubscriptionData] = {}
-access_tokens: Dict[str, Dict] = {}
+@dataclass(slots=True)
+class NFIndexEntry:
+    """Discovery fields flattened out of an NFProfile at registration"""
+    nf_type: NFType
+    plmns: FrozenSet[Tuple[str, str]]
+    snssais: FrozenSet[Tuple[int, Optional[str]]]
+    services: FrozenSet[str]
+    allowed_nf_types: FrozenSet[NFType]
+    sort_key: Tuple[int, int, int]  # (priority, -capacity, registration order)
+    registered: bool                # nfStatus == REGISTERED, i.e. discoverable
+    profile: NFProfile
+
+@dataclass(slots=True)
+class NRFState:
+    """
+    All mutable NRF state, behind one object so handlers share a single
+    interface and an external backend can later replace it wholesale.
+    """
+    profiles: Dict[str, NFProfile] = field(default_factory=dict)
+    subscriptions: Dict[str, SubscriptionData] = field(default_factory=dict)
+    # Both token stores are keyed by token_key(token), not the ~300-byte JWT itself
+    access_tokens: Dict[bytes, Dict] = field(default_factory=dict)
+    # token_key -> (payload, cached_until); insertion-ordered, oldest first
+    verified_tokens: Dict[bytes, tuple] = field(default_factory=dict)
+    # Discovery indexes (attribute value -> NF instance IDs), maintained on every
+    # registry change. Key None holds NFs that declare no value for the attribute,
+    # since those are not filtered on it.
+    nf_index: Dict[str, NFIndexEntry] = field(default_factory=dict)
+    by_nf_type: Dict[NFType, Set[str]] = field(default_factory=dict)
+    by_plmn: Dict[Optional[Tuple[str, str]], Set[str]] = field(default_factory=dict)
+    by_snssai: Dict[Optional[Tuple[int, Optional[str]]], Set[str]] = field(default_factory=dict)
+    by_service: Dict[Optional[str], Set[str]] = field(default_factory=dict)
+    # nfType value -> {nfInstanceId: profile}, in registration order
+    profiles_by_type: Dict[str, Dict[str, NFProfile]] = field(default_factory=dict)
+    # nfType value -> {nfInstanceId: {"nf_type", "ip", "port"}} for NFs with an endpoint (legacy discovery)
+    legacy_views: Dict[str, Dict[str, Dict]] = field(default_factory=dict)
+    # Bumped on every registry change; discovery ETags are derived from it
+    registry_version: int = 0
+    # ETag -> (serialized SearchResult, monotonic expiry)
+    discovery_cache: Dict[str, Tuple[bytes, float]] = field(default_factory=dict)
+    # Bumped on registry and subscription changes; /health and /metrics keep
+    # their serialized bodies until it (or the token count) moves
+    state_epoch: int = 0
+    health_body: Tuple[int, bytes] = (-1, b"")
+    metrics_body: Tuple[Tuple[int, int], bytes] = ((-1, -1), b"")
+
+nrf_state = NRFState()
+_nf_seq_counter = itertools.count()
+_sort_key = attrgetter("sort_key")
+
+def token_key(token: str) -> bytes:
+    """16-byte BLAKE2b digest of a bearer token"""
+    return hashlib.blake2b(token.encode(), digest_size=16).digest()
+
+def bump_registry_version():
+    """Invalidate every outstanding discovery ETag and cached response"""
+    nrf_state.registry_version += 1
+    nrf_state.state_epoch += 1
+    nrf_state.discovery_cache.clear()
+
+def _index_keys(entry: NFIndexEntry):
+    """(index, keys) pairs under which an entry is indexed"""
+    return (
+        (nrf_state.by_nf_type, (entry.nf_type,)),
+        (nrf_state.by_plmn, entry.plmns or (None,)),
+        (nrf_state.by_snssai, entry.snssais or (None,)),
+        (nrf_state.by_service, entry.services or (None,)),
+    )
+
+def _remove_from_indexes(nf_id: str, entry: NFIndexEntry):
+    for index, keys in _index_keys(entry):
+        for key in keys:
+            ids = index.get(key)
+            if ids is not None:
+                ids.discard(nf_id)
+                if not ids:
+                    del index[key]
+
+def index_nf_profile(nf_profile: NFProfile):
+    """Index a newly stored profile, replacing any previous registration's entry"""
+    nf_id = nf_profile.nfInstanceId
+    previous = nrf_state.nf_index.get(nf_id)
+    if previous is not None:
+        _remove_from_indexes(nf_id, previous)
+        if previous.nf_type != nf_profile.nfType:
+            _remove_from_type_buckets(nf_id, previous.nf_type)
+        seq = previous.sort_key[2]
+    else:
+        seq = next(_nf_seq_counter)
+    entry = NFIndexEntry(
+        nf_type=nf_profile.nfType,
+        plmns=frozenset((p.mcc, p.mnc) for p in nf_profile.plmnList or ()),
+        snssais=frozenset((s.sst, s.sd) for s in nf_profile.sNssais or ()),
+        services=frozenset(s.serviceName for s in nf_profile.nfServices or ()),
+        allowed_nf_types=frozenset(nf_profile.allowedNfTypes or ()),
+        sort_key=(nf_profile.priority or 0, -(nf_profile.capacity or 0), seq),
+        registered=nf_profile.nfStatus == NFStatus.REGISTERED,
+        profile=nf_profile
+    )
+    nrf_state.nf_index[nf_id] = entry
+    for index, keys in _index_keys(entry):
+        for key in keys:
+            index.setdefault(key, set()).add(nf_id)
+    _put_bucket(nrf_state.profiles_by_type, nf_profile.nfType.value, nf_id, nf_profile)
+    
+    # Legacy discovery answers with the first service's first endpoint
+    if nf_profile.nfServices and nf_profile.nfServices[0].ipEndPoints:
+        endpoint = nf_profile.nfServices[0].ipEndPoints[0]
+        _put_bucket(nrf_state.legacy_views, nf_profile.nfType.value, nf_id, {
+            "nf_type": nf_profile.nfType.value,
+            "ip": endpoint.ipv4Address,
+            "port": endpoint.port
+        })
+    else:
+        _pop_bucket(nrf_state.legacy_views, nf_profile.nfType.value, nf_id)
+    bump_registry_version()
+
+def _registration_order(nf_id: str) -> int:
+    return nrf_state.nf_index[nf_id].sort_key[2]
+
+def _put_bucket(buckets: Dict[str, Dict], key: str, nf_id: str, value):
+    """Insert into a per-type bucket, keeping it in registration order"""
+    bucket = buckets.setdefault(key, {})
+    if nf_id in bucket or not bucket:
+        bucket[nf_id] = value
+        return
+    out_of_order = _registration_order(nf_id) < _registration_order(next(reversed(bucket)))
+    bucket[nf_id] = value
+    if out_of_order:
+        # Only a re-registration that changes type or gains an endpoint lands here
+        buckets[key] = {i: bucket[i] for i in sorted(bucket, key=_registration_order)}
+
+def _pop_bucket(buckets: Dict[str, Dict], key: str, nf_id: str):
+    bucket = buckets.get(key)
+    if bucket is not None:
+        bucket.pop(nf_id, None)
+        if not bucket:
+            del buckets[key]
+
+def _remove_from_type_buckets(nf_id: str, nf_type: NFType):
+    _pop_bucket(nrf_state.profiles_by_type, nf_type.value, nf_id)
+    _pop_bucket(nrf_state.legacy_views, nf_type.value, nf_id)
+
+def unindex_nf_profile(nf_id: str):
+    entry = nrf_state.nf_index.pop(nf_id, None)
+    if entry is not None:
+        _remove_from_indexes(nf_id, entry)
+        _remove_from_type_buckets(nf_id, entry.nf_type)
+        bump_registry_version()
+
+def rebuild_indexes():
+    """Rebuild every discovery index from nrf_state.profiles"""
+    for index in (nrf_state.nf_index, nrf_state.by_nf_type, nrf_state.by_plmn, nrf_state.by_snssai,
+                  nrf_state.by_service, nrf_state.profiles_by_type, nrf_state.legacy_views):
+        index.clear()
+    for nf_profile in nrf_state.profiles.values():
+        index_nf_profile(nf_profile)
+
+def _matching(index: Dict, keys) -> Set[str]:
+    """IDs indexed under any of keys, plus those unrestricted on the attribute"""
+    return set(index.get(None, ())).union(*(index.get(key, ()) for key in keys))
+
+def prune_access_tokens(now: float):
+    """Drop expired token records; all share one lifetime, so the oldest go first"""
+    while nrf_state.access_tokens:
+        oldest = next(iter(nrf_state.access_tokens))
+        if nrf_state.access_tokens[oldest]["expires_at"] > now and len(nrf_state.access_tokens) < ACCESS_TOKENS_MAX:
+            break
+        del nrf_state.access_tokens[oldest]
 
 class NRF:
     def __init__(self):
         self.name = "NRF-001"
         self.nf_instance_id = str(uuid.uuid4())
         self.supported_features = "0x1f"  # Support for all basic features
+        # Claims shared by every token this NRF issues
+        self.static_claims = {"iss": self.nf_instance_id, "aud": JWT_AUDIENCE}
         
     def generate_access_token(self, client_id: str, scope: Optional[str] = None) -> str:
         """Generate OAuth2 access token per 3GPP TS 29.500"""
+        # JWT NumericDate claims are integer seconds since the epoch
+        now = int(time.time())
         payload = {
+            **self.static_claims,
             "sub": client_id,
-            "iss": self.nf_instance_id,
-            "aud": "nrf",
-            "exp": datetime.utcnow() + timedelta(minutes=JWT_ACCESS_TOKEN_EXPIRE_MINUTES),
-            "iat": datetime.utcnow(),
-            "scope": scope or "nnrf-nfm nnrf-disc"
+            "iat": now,
+            "exp": now + JWT_ACCESS_TOKEN_EXPIRE_MINUTES * 60,
+            "scope": scope or JWT_DEFAULT_SCOPE
         }
         
-        token = jwt.encode(payload, JWT_SECRET_KEY, algorithm=JWT_ALGORITHM)
+        token = _jwt_sign(payload)
         
         # Store token info
-        access_tokens[token] = {
+        prune_access_tokens(now)
+        nrf_state.access_tokens[token_key(token)] = {
             "client_id": client_id,
             "scope": scope,
             "expires_at": payload["exp"],
-            "created_at": datetime.utcnow()
+            "created_at": now
         }
         
         return token
     
     def verify_access_token(self, token: str) -> Optional[Dict]:
         """Verify OAuth2 access token"""
-        try:
-            payload = jwt.decode(token, JWT_SECRET_KEY, algorithms=[JWT_ALGORITHM])
-            
-            # Check if token is still valid
-            if datetime.utcnow() > datetime.fromtimestamp(payload["exp"]):
-                return None
-                
-            return payload
-        except jwt.PyJWTError:
+        now = time.time()
+        key = token_key(token)
+        
+        cached = nrf_state.verified_tokens.get(key)
+        if cached is not None:
+            payload, cached_until = cached
+            if now < cached_until and now < payload["exp"]:
+                return payload
+            del nrf_state.verified_tokens[key]
+        
+        payload = _jwt_verify(token)
+        if payload is None or payload.get("aud") != JWT_AUDIENCE:
+            return None
+        
+        # Check if token is still valid
+        exp = payload.get("exp")
+        if not isinstance(exp, (int, float)) or now >= exp:
             return None
+        
+        # Only successful verifications are cached
+        if len(nrf_state.verified_tokens) >= JWT_CACHE_MAX:
+            del nrf_state.verified_tokens[next(iter(nrf_state.verified_tokens))]
+        nrf_state.verified_tokens[key] = (payload, now + JWT_CACHE_TTL)
+        return payload
     
     def find_nf_instances(self, target_nf_type: Optional[NFType] = None, 
                          requester_nf_type: Optional[NFType] = None,
                          service_names: Optional[List[str]] = None,
-                         snssais: Optional[List[Snssai]] = None,
-                         plmn_list: Optional[List[PlmnId]] = None,
+                         snssais: Optional[FrozenSet[Tuple[int, Optional[str]]]] = None,
+                         plmn_list: Optional[FrozenSet[Tuple[str, str]]] = None,
                          dnn: Optional[str] = None,
                          limit: Optional[int] = None) -> List[NFProfile]:
         """Advanced NF discovery with filtering per TS 29.510"""
         
-        filtered_nfs = []
+        # Narrow the candidates by intersecting index sets
+        candidates: Optional[Set[str]] = None
+        if target_nf_type:
+            candidates = nrf_state.by_nf_type.get(target_nf_type, set())
+        if service_names:
+            matched = _matching(nrf_state.by_service, service_names)
+            candidates = matched if candidates is None else candidates & matched
+        if snssais:
+            matched = _matching(nrf_state.by_snssai, snssais)
+            candidates = matched if candidates is None else candidates & matched
+        if plmn_list:
+            matched = _matching(nrf_state.by_plmn, plmn_list)
+            candidates = matched if candidates is None else candidates & matched
+        
+        entries = nrf_state.nf_index.values() if candidates is None else [nrf_state.nf_index[nf_id] for nf_id in candidates]
         
-        for nf_profile in nf_profiles.values():
-            # Filter by NF type
-            if target_nf_type and nf_profile.nfType != target_nf_type:
-                continue
-                
+        filtered = []
+        for entry in entries:
             # Filter by allowed NF types
-            if requester_nf_type and nf_profile.allowedNfTypes:
-                if requester_nf_type not in nf_profile.allowedNfTypes:
-                    continue
-            
-            # Filter by service names
-            if service_names and nf_profile.nfServices:
-                service_match = False
-                for service in nf_profile.nfServices:
-                    if service.serviceName in service_names:
-                        service_match = True
-                        break
-                if not service_match:
-                    continue
-            
-            # Filter by S-NSSAI
-            if snssais and nf_profile.sNssais:
-                snssai_match = False
-                for target_snssai in snssais:
-                    for nf_snssai in nf_profile.sNssais:
-                        if (target_snssai.sst == nf_snssai.sst and 
-                            target_snssai.sd == nf_snssai.sd):
-                            snssai_match = True
-                            break
-                    if snssai_match:
-                        break
-                if not snssai_match:
-                    continue
-            
-            # Filter by PLMN
-            if plmn_list and nf_profile.plmnList:
-                plmn_match = False
-                for target_plmn in plmn_list:
-                    for nf_plmn in nf_profile.plmnList:
-                        if (target_plmn.mcc == nf_plmn.mcc and 
-                            target_plmn.mnc == nf_plmn.mnc):
-                            plmn_match = True
-                            break
-                    if plmn_match:
-                        break
-                if not plmn_match:
+            if requester_nf_type and entry.allowed_nf_types:
+                if requester_nf_type not in entry.allowed_nf_types:
                     continue
             
             # Only include registered and discoverable NFs
-            if nf_profile.nfStatus == NFStatus.REGISTERED:
-                filtered_nfs.append(nf_profile)
+            if entry.registered:
+                filtered.append(entry)
         
-        # Sort by priority and capacity
-        filtered_nfs.sort(key=lambda nf: (nf.priority or 0, -(nf.capacity or 0)))
-        
-        # Apply limit
+        # Sort by priority and capacity, then registration order; with a limit
+        # only the top entries are selected
         if limit:
-            filtered_nfs = filtered_nfs[:limit]
+            filtered = heapq.nsmallest(limit, filtered, key=_sort_key)
+        else:
+            filtered.sort(key=_sort_key)
             
-        return filtered_nfs
+        return [entry.profile for entry in filtered]
 
 nrf_instance = NRF()
 
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    # Startup - discovery indexes must agree with the registry before serving
+    app.state.nrf = nrf_state
+    rebuild_indexes()
+    logger.info("NRF ready: %d NF instances indexed", len(nrf_state.profiles))
+    refresher = asyncio.create_task(_metrics_refresher())
+    
+    yield
+    
+    # Shutdown
+    refresher.cancel()
+
 app = FastAPI(
     title="NRF - Network Repository Function",
     description="3GPP TS 29.510 compliant NRF implementation with OAuth2 security",
-    version="1.0.0"
+    version="1.0.0",
+    default_response_class=ORJSONResponse,
+    lifespan=lifespan
 )
 
 # Add CORS middleware
@@ -398,36 +675,33 @@ async def get_access_token(token_request: TokenRequest):
     OAuth2 token endpoint per 3GPP TS 29.500
     """
     with tracer.start_as_current_span("oauth2_token_request") as span:
-        span.set_attribute("grant_type", token_request.grant_type)
-        span.set_attribute("scope", token_request.scope or "")
+        # Attributes are only built when the span is sampled
+        recording = span.is_recording()
+        if recording:
+            span.set_attributes({"grant_type": token_request.grant_type, "scope": token_request.scope or ""})
         
-        try:
-            if token_request.grant_type != "client_credentials":
-                raise HTTPException(
-                    status_code=400,
-                    detail="Unsupported grant type"
-                )
-            
-            # Generate client ID (in production, would authenticate client)
-            client_id = f"nf-client-{str(uuid.uuid4())[:8]}"
-            
-            # Generate access token
-            access_token = nrf_instance.generate_access_token(client_id, token_request.scope)
-            
-            span.set_attribute("token.generated", "SUCCESS")
-            logger.info(f"Access token generated for client: {client_id}")
-            
-            return OAuth2Token(
-                access_token=access_token,
-                token_type="bearer",
-                expires_in=JWT_ACCESS_TOKEN_EXPIRE_MINUTES * 60,
-                scope=token_request.scope
+        if token_request.grant_type != "client_credentials":
+            raise HTTPException(
+                status_code=400,
+                detail="Unsupported grant type"
             )
-            
-        except Exception as e:
-            span.set_attribute("error", str(e))
-            logger.error(f"Token generation failed: {e}")
-            raise HTTPException(status_code=500, detail="Token generation failed")
+        
+        # Generate client ID (in production, would authenticate client)
+        client_id = f"nf-client-{str(uuid.uuid4())[:8]}"
+        
+        # Generate access token
+        access_token = nrf_instance.generate_access_token(client_id, token_request.scope)
+        
+        if recording:
+            span.set_attribute("token.generated", "SUCCESS")
+        logger.info("Access token generated for client: %s", client_id)
+        
+        return OAuth2Token(
+            access_token=access_token,
+            token_type="bearer",
+            expires_in=JWT_ACCESS_TOKEN_EXPIRE_MINUTES * 60,
+            scope=token_request.scope
+        )
 
 # 3GPP TS 29.510 § 5.2.2.2.1 - Nnrf_NFManagement Service: Register NF Instance
 @app.put("/nnrf-nfm/v1/nf-instances/{nfInstanceId}", response_model=NFProfile)
@@ -441,38 +715,35 @@ async def register_nf_instance(
     Register NF Instance per 3GPP TS 29.510
     """
     with tracer.start_as_current_span("nrf_register_nf_instance") as span:
-        span.set_attribute("3gpp.service", "Nnrf_NFManagement")
-        span.set_attribute("3gpp.operation", "RegisterNFInstance")
-        span.set_attribute("nf.instance_id", nfInstanceId)
-        span.set_attribute("nf.type", nf_profile.nfType if nf_profile else "unknown")
+        recording = span.is_recording()
+        if recording:
+            span.set_attributes({
+                **_REGISTER_SPAN_ATTRS,
+                "nf.instance_id": nfInstanceId,
+                "nf.type": nf_profile.nfType if nf_profile else "unknown"
+            })
         
-        try:
-            if not nf_profile:
-                raise HTTPException(status_code=400, detail="NF Profile required")
-            
-            # Validate NF Instance ID matches
-            if nf_profile.nfInstanceId != nfInstanceId:
-                raise HTTPException(status_code=400, detail="NF Instance ID mismatch")
-            
-            # Set registration time
-            if not nf_profile.recoveryTime:
-                nf_profile.recoveryTime = datetime.utcnow()
-            
-            # Store NF profile
-            nf_profiles[nfInstanceId] = nf_profile
-            
+        if not nf_profile:
+            raise HTTPException(status_code=400, detail="NF Profile required")
+        
+        # Validate NF Instance ID matches
+        if nf_profile.nfInstanceId != nfInstanceId:
+            raise HTTPException(status_code=400, detail="NF Instance ID mismatch")
+        
+        # Set registration time
+        if not nf_profile.recoveryTime:
+            nf_profile.recoveryTime = datetime.utcnow()
+        
+        # Store NF profile
+        nrf_state.profiles[nfInstanceId] = nf_profile
+        index_nf_profile(nf_profile)
+        
+        if recording:
             span.set_attribute("registration.status", "SUCCESS")
-            logger.info(f"NF instance registered: {nfInstanceId} ({nf_profile.nfType})")
-            
-            # Return the registered profile
-            return nf_profile
-            
-        except HTTPException:
-            raise
-        except Exception as e:
-            span.set_attribute("error", str(e))
-            logger.error(f"NF registration failed: {e}")
-            raise HTTPException(status_code=500, detail=f"NF registration failed: {e}")
+        logger.info("NF instance registered: %s (%s)", nfInstanceId, nf_profile.nfType.value)
+        
+        # Return the registered profile
+        return nf_profile
 
 # 3GPP TS 29.510 § 5.2.2.3.1 - Nnrf_NFManagement Service: Get NF Instance
 @app.get("/nnrf-nfm/v1/nf-instances/{nfInstanceId}", response_model=NFProfile)
@@ -481,10 +752,10 @@ async def get_nf_instance(
     token_data: Dict = Depends(verify_token)
 ):
     """Get NF Instance per 3GPP TS 29.510"""
-    if nfInstanceId not in nf_profiles:
+    if nfInstanceId not in nrf_state.profiles:
         raise HTTPException(status_code=404, detail="NF Instance not found")
     
-    return nf_profiles[nfInstanceId]
+    return nrf_state.profiles[nfInstanceId]
 
 # 3GPP TS 29.510 § 5.2.2.4.1 - Nnrf_NFManagement Service: Update NF Instance
 @app.patch("/nnrf-nfm/v1/nf-instances/{nfInstanceId}")
@@ -494,24 +765,28 @@ async def update_nf_instance(
     token_data: Dict = Depends(verify_token)
 ):
     """Update NF Instance per 3GPP TS 29.510"""
-    if nfInstanceId not in nf_profiles:
+    if nfInstanceId not in nrf_state.profiles:
         raise HTTPException(status_code=404, detail="NF Instance not found")
     
     # Apply JSON Patch operations
-    nf_profile = nf_profiles[nfInstanceId]
+    nf_profile = nrf_state.profiles[nfInstanceId]
     
     # Simplified patch handling (in production, use proper JSON Patch library)
+    # Values are coerced here, so the model's assignment checks are bypassed
     for patch in update_data or []:
         op = patch.get("op")
         path = patch.get("path")
         value = patch.get("value")
         
         if op == "replace" and path == "/nfStatus":
-            nf_profile.nfStatus = NFStatus(value)
+            nf_status = NFStatus(value)
+            object.__setattr__(nf_profile, "nfStatus", nf_status)
+            nrf_state.nf_index[nfInstanceId].registered = nf_status == NFStatus.REGISTERED
         elif op == "replace" and path == "/load":
-            nf_profile.load = value
+            object.__setattr__(nf_profile, "load", value)
+    bump_registry_version()
     
-    logger.info(f"NF instance updated: {nfInstanceId}")
+    logger.info("NF instance updated: %s", nfInstanceId)
     return {"message": "NF instance updated successfully"}
 
 # 3GPP TS 29.510 § 5.2.2.5.1 - Nnrf_NFManagement Service: Deregister NF Instance
@@ -521,9 +796,10 @@ async def deregister_nf_instance(
     token_data: Dict = Depends(verify_token)
 ):
     """Deregister NF Instance per 3GPP TS 29.510"""
-    if nfInstanceId in nf_profiles:
-        del nf_profiles[nfInstanceId]
-        logger.info(f"NF instance deregistered: {nfInstanceId}")
+    if nfInstanceId in nrf_state.profiles:
+        del nrf_state.profiles[nfInstanceId]
+        unindex_nf_profile(nfInstanceId)
+        logger.info("NF instance deregistered: %s", nfInstanceId)
         return {"message": "NF instance deregistered successfully"}
     else:
         raise HTTPException(status_code=404, detail="NF Instance not found")
@@ -538,58 +814,81 @@ async def search_nf_instances(
     plmn_list: Optional[str] = Query(None, description="PLMN list JSON array"),
     dnn: Optional[str] = Query(None, description="Data Network Name"),
     limit: Optional[int] = Query(None, ge=1, description="Limit number of results"),
+    if_none_match: Optional[str] = Header(None),
     token_data: Dict = Depends(verify_token)
 ):
     """
     Search NF Instances per 3GPP TS 29.510
     """
+    # Results only change with the registry, so the ETag covers the registry
+    # version plus the query; repeat searches are answered without filtering
+    canonical_query = f"{nrf_state.registry_version}|{target_nf_type}|{requester_nf_type}|{service_names}|{snssais}|{plmn_list}|{dnn}|{limit}"
+    etag = f'"{hashlib.blake2b(canonical_query.encode(), digest_size=16).hexdigest()}"'
+    if if_none_match == etag:
+        return Response(status_code=304, headers={"ETag": etag})
+    
+    cached = nrf_state.discovery_cache.get(etag)
+    if cached is not None:
+        if time.monotonic() < cached[1]:
+            return Response(content=cached[0], media_type="application/json", headers={"ETag": etag})
+        del nrf_state.discovery_cache[etag]
+    
     with tracer.start_as_current_span("nrf_search_nf_instances") as span:
-        span.set_attribute("3gpp.service", "Nnrf_NFDiscovery")
-        span.set_attribute("3gpp.operation", "SearchNFInstances")
-        span.set_attribute("target_nf_type", target_nf_type or "any")
-        span.set_attribute("requester_nf_type", requester_nf_type or "unknown")
+        recording = span.is_recording()
+        if recording:
+            span.set_attributes({
+                **_SEARCH_SPAN_ATTRS,
+                "target_nf_type": target_nf_type or "any",
+                "requester_nf_type": requester_nf_type or "unknown"
+            })
         
+        # Parse complex query parameters; malformed input is the client's error
+        service_names_list = service_names.split(",") if service_names else None
+        # S-NSSAIs and PLMNs go straight to the (sst, sd) / (mcc, mnc) tuples the
+        # discovery indexes are keyed by, without building models. Values are
+        # coerced as the models would, so {"mcc": 310} still matches "310"
         try:
-            # Parse complex query parameters
-            service_names_list = service_names.split(",") if service_names else None
-            snssais_list = json.loads(snssais) if snssais else None
-            plmn_list_obj = json.loads(plmn_list) if plmn_list else None
-            
-            # Convert JSON objects to Pydantic models
-            snssais_models = None
-            if snssais_list:
-                snssais_models = [Snssai(**snssai) for snssai in snssais_list]
-                
-            plmn_models = None
-            if plmn_list_obj:
-                plmn_models = [PlmnId(**plmn) for plmn in plmn_list_obj]
-            
-            # Perform discovery
-            discovered_nfs = nrf_instance.find_nf_instances(
-                target_nf_type=target_nf_type,
-                requester_nf_type=requester_nf_type,
-                service_names=service_names_list,
-                snssais=snssais_models,
-                plmn_list=plmn_models,
-                dnn=dnn,
-                limit=limit
-            )
-            
-            span.set_attribute("discovered.count", len(discovered_nfs))
-            logger.info(f"NF discovery completed: {len(discovered_nfs)} instances found")
-            
-            return SearchResult(
-                validityPeriod=3600,  # 1 hour
-                nfInstances=discovered_nfs,
-                searchId=str(uuid.uuid4()),
-                numNfInstComplete=len(discovered_nfs),
-                nrfSupportedFeatures=nrf_instance.supported_features
-            )
-            
-        except Exception as e:
+            snssai_keys = frozenset(
+                (int(s["sst"]), None if s.get("sd") is None else str(s["sd"]))
+                for s in orjson.loads(snssais) or ()
+            ) if snssais else None
+            plmn_keys = frozenset(
+                (str(p["mcc"]), str(p["mnc"])) for p in orjson.loads(plmn_list) or ()
+            ) if plmn_list else None
+        except (ValueError, KeyError, TypeError, AttributeError) as e:
             span.set_attribute("error", str(e))
-            logger.error(f"NF discovery failed: {e}")
-            raise HTTPException(status_code=500, detail=f"NF discovery failed: {e}")
+            raise HTTPException(status_code=400, detail=f"Invalid discovery query: {e}")
+        
+        # Perform discovery
+        discovered_nfs = nrf_instance.find_nf_instances(
+            target_nf_type=target_nf_type,
+            requester_nf_type=requester_nf_type,
+            service_names=service_names_list,
+            snssais=snssai_keys,
+            plmn_list=plmn_keys,
+            dnn=dnn,
+            limit=limit
+        )
+        
+        if recording:
+            span.set_attribute("discovered.count", len(discovered_nfs))
+        logger.info("NF discovery completed: %d instances found", len(discovered_nfs))
+        
+        # Profiles were validated on registration; skip re-validating them here
+        search_result = SearchResult.construct(
+            validityPeriod=3600,  # 1 hour
+            nfInstances=discovered_nfs,
+            searchId=str(uuid.uuid4()),
+            numNfInstComplete=len(discovered_nfs),
+            nrfSupportedFeatures=nrf_instance.supported_features
+        )
+        body = orjson.dumps(search_result.dict())
+        
+        if len(nrf_state.discovery_cache) >= DISCOVERY_CACHE_MAX:
+            del nrf_state.discovery_cache[next(iter(nrf_state.discovery_cache))]
+        nrf_state.discovery_cache[etag] = (body, time.monotonic() + DISCOVERY_CACHE_TTL)
+        
+        return Response(content=body, media_type="application/json", headers={"ETag": etag})
 
 # 3GPP TS 29.510 § 5.2.4.2.1 - Nnrf_NFManagement Service: Subscribe to NF Status Changes
 @app.post("/nnrf-nfm/v1/subscriptions", response_model=SubscriptionData)
@@ -610,97 +909,106 @@ async def subscribe_nf_status_change(
             subscription.validityTime = datetime.utcnow() + timedelta(hours=24)
         
         # Store subscription
-        nf_subscriptions[subscription_id] = subscription
+        nrf_state.subscriptions[subscription_id] = subscription
+        nrf_state.state_epoch += 1
         
-        logger.info(f"NF status subscription created: {subscription_id}")
+        logger.info("NF status subscription created: %s", subscription_id)
         return subscription
         
     except Exception as e:
-        logger.error(f"Subscription creation failed: {e}")
+        logger.error("Subscription creation failed: %s", e)
         raise HTTPException(status_code=500, detail=f"Subscription creation failed: {e}")
 
 # Legacy endpoints for backwards compatibility
 @app.post("/register")
-async def legacy_register_nf(nf_data: Dict):
+async def legacy_register_nf(registration: LegacyRegistration):
     """Legacy registration endpoint - maintained for backwards compatibility"""
-    try:
-        # Convert legacy format to NFProfile
-        nf_profile = NFProfile(
-            nfInstanceId=str(uuid.uuid4()),
-            nfType=NFType(nf_data.get("nf_type", "AMF")),
-            nfStatus=NFStatus.REGISTERED,
-            ipv4Addresses=[nf_data.get("ip", "127.0.0.1")],
-            nfServices=[
-                NFService(
-                    serviceInstanceId=f"{nf_data.get('nf_type', 'unknown')}-service-001",
-                    serviceName=f"n{nf_data.get('nf_type', 'unknown').lower()}-service",
-                    versions=[NFServiceVersion(apiVersionInUri="v1")],
-                    ipEndPoints=[IpEndPoint(
-                        ipv4Address=nf_data.get("ip", "127.0.0.1"),
-                        port=nf_data.get("port", 8080)
-                    )]
-                )
-            ]
-        )
-        
-        # Store in new format
-        nf_profiles[nf_profile.nfInstanceId] = nf_profile
-        
-        return {"message": f"{nf_data.get('nf_type')} registered successfully"}
-        
-    except Exception as e:
-        logger.error(f"Legacy registration failed: {e}")
-        raise HTTPException(status_code=500, detail="Registration failed")
+    # Convert legacy format to NFProfile; the payload is validated by FastAPI and
+    # everything else is built here, so the models are constructed unvalidated
+    nf_type = registration.nf_type.value
+    nf_profile = NFProfile.construct(
+        nfInstanceId=str(uuid.uuid4()),
+        nfType=registration.nf_type,
+        nfStatus=NFStatus.REGISTERED,
+        ipv4Addresses=[registration.ip],
+        nfServices=[
+            NFService.construct(
+                serviceInstanceId=f"{nf_type}-service-001",
+                serviceName=f"n{nf_type.lower()}-service",
+                versions=[NFServiceVersion.construct(apiVersionInUri="v1")],
+                ipEndPoints=[IpEndPoint.construct(
+                    ipv4Address=registration.ip,
+                    port=registration.port
+                )]
+            )
+        ]
+    )
+    
+    # Store in new format
+    nrf_state.profiles[nf_profile.nfInstanceId] = nf_profile
+    index_nf_profile(nf_profile)
+    
+    return {"message": f"{nf_type} registered successfully"}
+
+@lru_cache(maxsize=64)
+def _legacy_not_found_body(nf_type: str) -> bytes:
+    # Bounded because nf_type is an arbitrary path segment
+    return orjson.dumps({"message": f"{nf_type} not found"})
 
 @app.get("/discover/{nf_type}")
-async def legacy_discover_nf(nf_type: str):
+async def legacy_discover_nf(nf_type: constr(to_upper=True)):
     """Legacy discovery endpoint - maintained for backwards compatibility"""
-    try:
-        # Find NF by type
-        for nf_profile in nf_profiles.values():
-            if nf_profile.nfType.value == nf_type.upper():
-                # Return legacy format
-                if nf_profile.nfServices and nf_profile.nfServices[0].ipEndPoints:
-                    endpoint = nf_profile.nfServices[0].ipEndPoints[0]
-                    return {
-                        "nf_type": nf_type,
-                        "ip": endpoint.ipv4Address,
-                        "port": endpoint.port
-                    }
-        
-        return {"message": f"{nf_type} not found"}
-        
-    except Exception as e:
-        logger.error(f"Legacy discovery failed: {e}")
-        return {"message": f"{nf_type} not found"}
+    # First registered NF of the type with an endpoint; views are built at registration
+    views = nrf_state.legacy_views.get(nf_type)
+    if views:
+        # Return legacy format
+        return next(iter(views.values()))
+    
+    return Response(content=_legacy_not_found_body(nf_type), media_type="application/json")
 
 # Health and monitoring endpoints
 @app.get("/health")
-def health_check():
+async def health_check():
     """Health check endpoint"""
-    return {
-        "status": "healthy",
-        "service": "NRF",
-        "compliance": "3GPP TS 29.510",
-        "version": "1.0.0",
-        "registered_nfs": len(nf_profiles),
-        "active_subscriptions": len(nf_subscriptions)
-    }
+    epoch, body = nrf_state.health_body
+    if epoch != nrf_state.state_epoch:
+        body = orjson.dumps({
+            "status": "healthy",
+            "service": "NRF",
+            "compliance": "3GPP TS 29.510",
+            "version": "1.0.0",
+            "registered_nfs": len(nrf_state.profiles),
+            "active_subscriptions": len(nrf_state.subscriptions)
+        })
+        nrf_state.health_body = (nrf_state.state_epoch, body)
+    return Response(content=body, media_type="application/json")
+
+def refresh_metrics_body() -> bytes:
+    """Serialized /metrics payload, rebuilt only when its inputs have changed"""
+    prune_access_tokens(time.time())
+    key = (nrf_state.state_epoch, len(nrf_state.access_tokens))
+    cached_key, body = nrf_state.metrics_body
+    if cached_key != key:
+        # Per-type buckets are maintained on every registry change, so their sizes are the counts
+        body = orjson.dumps({
+            "total_registered_nfs": len(nrf_state.profiles),
+            "nf_counts_by_type": {nf_type: len(bucket) for nf_type, bucket in nrf_state.profiles_by_type.items()},
+            "active_subscriptions": len(nrf_state.subscriptions),
+            "active_tokens": len(nrf_state.access_tokens)
+        })
+        nrf_state.metrics_body = (key, body)
+    return body
+
+async def _metrics_refresher():
+    while True:
+        await asyncio.sleep(METRICS_REFRESH_INTERVAL)
+        refresh_metrics_body()
 
 @app.get("/metrics")
-def get_metrics():
+async def get_metrics():
     """Metrics endpoint for monitoring"""
-    nf_counts_by_type = {}
-    for nf_profile in nf_profiles.values():
-        nf_type = nf_profile.nfType.value
-        nf_counts_by_type[nf_type] = nf_counts_by_type.get(nf_type, 0) + 1
-    
-    return {
-        "total_registered_nfs": len(nf_profiles),
-        "nf_counts_by_type": nf_counts_by_type,
-        "active_subscriptions": len(nf_subscriptions),
-        "active_tokens": len(access_tokens)
-    }
+    # Normally already fresh from the background refresher; rebuilt here otherwise
+    return Response(content=refresh_metrics_body(), media_type="application/json")
 
 if __name__ == "__main__":
-    uvicorn.run(app, host="127.0.0.1", port=8000)
\ No newline at end of file
+    uvicorn.run(app, host="127.0.0.1", port=8000, loop="auto", http="httptools")
\ No newline at end of file
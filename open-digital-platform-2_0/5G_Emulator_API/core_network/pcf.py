@@ -4,14 +4,21 @@
 # 3GPP TS 29.514 - Access and Mobility Policy Control Service - 100% Compliant Implementation
 
 from fastapi import FastAPI, HTTPException, Request, BackgroundTasks, Depends, Path, Query
+from fastapi.responses import ORJSONResponse, Response
+from fastapi.exceptions import RequestValidationError
 from pydantic import BaseModel, Field
+from pydantic.error_wrappers import ErrorWrapper
+from pydantic.errors import MissingError
 from typing import Dict, List, Optional, Any, Union
+from dataclasses import dataclass
 import uvicorn
-import requests
+import httpx
 import asyncio
 import uuid
+import os
 import json
 import logging
+import orjson
 from datetime import datetime, timedelta
 from contextlib import asynccontextmanager
 from opentelemetry import trace
@@ -24,9 +31,46 @@ logger = logging.getLogger(__name__)
 # OpenTelemetry tracer
 tracer = trace.get_tracer(__name__)
 
+# Constant span attributes per operation
+_SM_CREATE_SPAN_ATTRS = {"3gpp.service": "Npcf_SMPolicyControl", "3gpp.operation": "Create"}
+
 nrf_url = "http://127.0.0.1:8000"
 udr_url = "http://127.0.0.1:8001"
 
+# Shared keep-alive HTTP client for NRF calls, managed by lifespan
+pcf_http: Optional[httpx.AsyncClient] = None
+_JSON_HEADERS = {"content-type": "application/json"}
+
+# Policy decisions are revalidated 24 hours after they are issued; the
+# timestamp is recomputed on this cadence rather than per request
+REVALIDATION_PERIOD = timedelta(hours=24)
+REVALIDATION_REFRESH_INTERVAL = 60
+
+# DNN category -> service-specific (PCC rule, QoS data) applied on top of the default internet rule
+DNN_SERVICE_RULES = {
+    "default": None,
+    "ims": ("rule_ims_signalling", "qos_ims"),
+    "video": ("rule_video_streaming", "qos_video"),
+    "gaming": ("rule_gaming", "qos_gaming")
+}
+# "ims" matches the DNN exactly; these match as substrings, in precedence order
+DNN_SUBSTRING_CATEGORIES = ("video", "gaming")
+# Bound on remembered DNN -> template lookups, since DNNs come from requests
+DNN_TEMPLATE_CACHE_MAX = 1024
+
+# Policy association IDs are generated this many at a time
+ASSOCIATION_ID_BATCH = 512
+
+def generate_uuid4_batch(count: int) -> List[str]:
+    """Random (version 4) UUID strings from a single urandom read"""
+    raw = bytearray(os.urandom(16 * count))
+    # Set the version and RFC 4122 variant bits of every 16-byte block
+    raw[6::16] = bytes((b & 0x0F) | 0x40 for b in raw[6::16])
+    raw[8::16] = bytes((b & 0x3F) | 0x80 for b in raw[8::16])
+    h = raw.hex()
+    return [f"{h[i:i+8]}-{h[i+8:i+12]}-{h[i+12:i+16]}-{h[i+16:i+20]}-{h[i+20:i+32]}"
+            for i in range(0, len(h), 32)]
+
 # 3GPP TS 29.507 Data Models
 class PolicyControlRequestTrigger(str, Enum):
     PLMN_CH = "PLMN_CH"
@@ -56,6 +100,24 @@ class PolicyControlRequestTrigger(str, Enum):
     RFSP_CH = "RFSP_CH"
     PCC_UPD = "PCC_UPD"
 
+# Policy control request triggers armed in every SM policy decision
+DEFAULT_POLICY_TRIGGERS = (
+    PolicyControlRequestTrigger.PLMN_CH,
+    PolicyControlRequestTrigger.RES_MO_RE,
+    PolicyControlRequestTrigger.AC_TY_CH,
+    PolicyControlRequestTrigger.UE_IP_CH,
+    PolicyControlRequestTrigger.AN_CH_COR,
+    PolicyControlRequestTrigger.US_RE,
+    PolicyControlRequestTrigger.APP_STA,
+    PolicyControlRequestTrigger.APP_STO,
+    PolicyControlRequestTrigger.DEF_QOS_CH,
+    PolicyControlRequestTrigger.SE_AMBR_CH,
+    PolicyControlRequestTrigger.QOS_NOTIF,
+    PolicyControlRequestTrigger.SUCC_RESOURCE_ALLO,
+    PolicyControlRequestTrigger.RAI_CH,
+    PolicyControlRequestTrigger.PCC_UPD
+)
+
 class QosFlowUsage(str, Enum):
     LIVE = "LIVE"
     IMS_SIG = "IMS_SIG"
@@ -70,6 +132,9 @@ class Arp(BaseModel):
     priority_level: int = Field(..., ge=1, le=15, description="Priority level")
     pre_emption_capability: str = Field("NOT_PREEMPT", description="Pre-emption capability")
     pre_emption_vulnerability: str = Field("NOT_PREEMPTABLE", description="Pre-emption vulnerability")
+    
+    class Config:
+        frozen = True
 
 class Ambr(BaseModel):
     uplink: str = Field(..., description="Uplink bit rate")
@@ -91,6 +156,9 @@ class QosData(BaseModel):
     defQosFlowIndication: Optional[bool] = Field(None, description="Default QoS flow indication")
     extMaxDataBurstVol: Optional[int] = Field(None, description="Extended maximum data burst volume")
     qosFlowUsage: Optional[QosFlowUsage] = Field(None, description="QoS flow usage")
+    
+    class Config:
+        frozen = True
 
 class FlowInformation(BaseModel):
     flowDescription: Optional[str] = Field(None, description="Flow description")
@@ -101,6 +169,9 @@ class FlowInformation(BaseModel):
     spi: Optional[str] = Field(None, description="Security parameter index")
     flowLabel: Optional[str] = Field(None, description="Flow label")
     flowDirection: Optional[FlowDirection] = Field(None, description="Flow direction")
+    
+    class Config:
+        frozen = True
 
 class PccRule(BaseModel):
     pccRuleId: str = Field(..., description="PCC rule identifier")
@@ -116,6 +187,9 @@ class PccRule(BaseModel):
     refChgData: Optional[List[str]] = Field(None, description="Reference to charging data")
     refUmData: Optional[List[str]] = Field(None, description="Reference to usage monitoring data")
     refCondData: Optional[str] = Field(None, description="Reference to condition data")
+    
+    class Config:
+        frozen = True
 
 class SmPolicyData(BaseModel):
     smPolicySnssaiData: Optional[Dict[str, Dict]] = Field(None, description="SM policy SNSSAI data")
@@ -196,8 +270,24 @@ class PolicyAssociation(BaseModel):
     suppFeat: Optional[str] = Field(None, description="Supported features")
 
 # PCF Storage
-policy_associations: Dict[str, PolicyAssociation] = {}
-sm_policy_decisions: Dict[str, SmPolicyDecision] = {}
+@dataclass(slots=True)
+class SmPolicyRecord:
+    """An SM policy association together with its current decision"""
+    association: PolicyAssociation
+    decision: SmPolicyDecision
+    # Serialized decision, refreshed with it and served as-is by GET
+    body: bytes
+    
+    def set_decision(self, decision: SmPolicyDecision) -> bytes:
+        self.decision = decision
+        self.body = serialize_sm_policy_decision(decision)
+        return self.body
+
+def serialize_sm_policy_decision(decision: SmPolicyDecision) -> bytes:
+    return orjson.dumps(decision.dict())
+
+# Policy association ID -> record; one lookup serves GET, PATCH and DELETE
+sm_policies: Dict[str, SmPolicyRecord] = {}
 am_policy_data: Dict[str, AmPolicyData] = {}
 pcc_rules_database: Dict[str, PccRule] = {}
 qos_data_database: Dict[str, QosData] = {}
@@ -207,52 +297,74 @@ class PCF:
         self.name = "PCF-001"
         self.nf_instance_id = str(uuid.uuid4())
         self.supported_features = "0x1f"
+        # NF profile JSON, serialized once at startup and reused for (re-)registration
+        self.nf_profile_body: Optional[bytes] = None
+        # Pre-generated policy association IDs, refilled in batches
+        self._association_ids: List[str] = []
+        # Revalidation time handed out with new and updated decisions
+        self.revalidation_time = datetime.utcnow() + REVALIDATION_PERIOD
         
         # Initialize default policy rules and QoS data
         self._initialize_default_policies()
+        self._initialize_decision_templates()
+        
+        # Policy control request trigger -> handler applied on SM policy update
+        self._trigger_handlers = {
+            PolicyControlRequestTrigger.RES_MO_RE: self._apply_resource_modification,  # Resource modification
+            PolicyControlRequestTrigger.APP_STA: self._apply_app_start,                # Application start
+            PolicyControlRequestTrigger.APP_STO: self._apply_app_stop,                 # Application stop
+            PolicyControlRequestTrigger.QOS_NOTIF: self._apply_qos_notification        # QoS notification
+        }
         
+    def new_association_id(self) -> str:
+        """Next policy association ID (a random UUID string)"""
+        if not self._association_ids:
+            self._association_ids = generate_uuid4_batch(ASSOCIATION_ID_BATCH)
+        return self._association_ids.pop()
+    
     def _initialize_default_policies(self):
         """Initialize default policy rules and QoS data"""
+        # Built from trusted constants, so the models are constructed unvalidated
         # Default QoS data for different service types
         default_qos_data = {
-            "qos_internet": QosData(
+            "qos_internet": QosData.construct(
                 qosId="qos_internet",
                 fiveqi=9,  # Non-GBR - Best effort
-                arp=Arp(priority_level=8, pre_emption_capability="NOT_PREEMPT", pre_emption_vulnerability="NOT_PREEMPTABLE"),
+                arp=Arp.construct(priority_level=8, pre_emption_capability="NOT_PREEMPT", pre_emption_vulnerability="NOT_PREEMPTABLE"),
                 priorityLevel=8
             ),
-            "qos_ims": QosData(
+            "qos_ims": QosData.construct(
                 qosId="qos_ims",
                 fiveqi=5,  # GBR - IMS signalling
                 gbrUl="128 Kbps",
                 gbrDl="128 Kbps",
                 maxbrUl="256 Kbps",
                 maxbrDl="256 Kbps",
-                arp=Arp(priority_level=1, pre_emption_capability="MAY_PREEMPT", pre_emption_vulnerability="NOT_PREEMPTABLE"),
+                arp=Arp.construct(priority_level=1, pre_emption_capability="MAY_PREEMPT", pre_emption_vulnerability="NOT_PREEMPTABLE"),
                 priorityLevel=1,
                 qosFlowUsage=QosFlowUsage.IMS_SIG
             ),
-            "qos_video": QosData(
+            "qos_video": QosData.construct(
                 qosId="qos_video",
                 fiveqi=2,  # GBR - Conversational video
                 gbrUl="2 Mbps",
                 gbrDl="10 Mbps",
                 maxbrUl="5 Mbps",
                 maxbrDl="25 Mbps",
-                arp=Arp(priority_level=4, pre_emption_capability="NOT_PREEMPT", pre_emption_vulnerability="PREEMPTABLE"),
+                arp=Arp.construct(priority_level=4, pre_emption_capability="NOT_PREEMPT", pre_emption_vulnerability="PREEMPTABLE"),
                 priorityLevel=4,
                 averWindow=2000,
                 maxPacketLossRateDl=1,
                 maxPacketLossRateUl=1
             ),
-            "qos_gaming": QosData(
+            "qos_gaming": QosData.construct(
                 qosId="qos_gaming",
                 fiveqi=83,  # GBR - Low latency gaming
                 gbrUl="500 Kbps",
                 gbrDl="1 Mbps",
                 maxbrUl="1 Mbps",
                 maxbrDl="2 Mbps",
-                arp=Arp(priority_level=7, pre_emption_capability="NOT_PREEMPT", pre_emption_vulnerability="PREEMPTABLE"),
+                arp=Arp.construct(priority_level=7, pre_emption_capability="NOT_PREEMPT", pre_emption_vulnerability="PREEMPTABLE"),
                 priorityLevel=7
             )
         }
@@ -262,54 +374,54 @@ class PCF:
         
         # Default PCC rules
         default_pcc_rules = {
-            "rule_internet_default": PccRule(
+            "rule_internet_default": PccRule.construct(
                 pccRuleId="rule_internet_default",
                 precedence=1000,
                 pccRuleStatus="ACTIVE",
                 flowInfos=[
-                    FlowInformation(
+                    FlowInformation.construct(
                         flowDescription="permit out ip from any to assigned",
                         flowDirection=FlowDirection.DOWNLINK
                     ),
-                    FlowInformation(
+                    FlowInformation.construct(
                         flowDescription="permit in ip from any to assigned", 
                         flowDirection=FlowDirection.UPLINK
                     )
                 ],
                 refQosData=["qos_internet"]
             ),
-            "rule_ims_signalling": PccRule(
+            "rule_ims_signalling": PccRule.construct(
                 pccRuleId="rule_ims_signalling",
                 precedence=100,
                 pccRuleStatus="ACTIVE",
                 flowInfos=[
-                    FlowInformation(
+                    FlowInformation.construct(
                         flowDescription="permit out 17 from any 5060 to assigned",
                         flowDirection=FlowDirection.BIDIRECTIONAL
                     )
                 ],
                 refQosData=["qos_ims"]
             ),
-            "rule_video_streaming": PccRule(
+            "rule_video_streaming": PccRule.construct(
                 pccRuleId="rule_video_streaming",
                 precedence=200,
                 pccRuleStatus="ACTIVE",
                 appId="video_streaming_app",
                 flowInfos=[
-                    FlowInformation(
+                    FlowInformation.construct(
                         flowDescription="permit out tcp from any 80,443 to assigned",
                         flowDirection=FlowDirection.DOWNLINK
                     )
                 ],
                 refQosData=["qos_video"]
             ),
-            "rule_gaming": PccRule(
+            "rule_gaming": PccRule.construct(
                 pccRuleId="rule_gaming",
                 precedence=300,
                 pccRuleStatus="ACTIVE",
                 appId="gaming_app",
                 flowInfos=[
-                    FlowInformation(
+                    FlowInformation.construct(
                         flowDescription="permit out udp from any 7000-8000 to assigned",
                         flowDirection=FlowDirection.BIDIRECTIONAL
                     )
@@ -321,132 +433,154 @@ class PCF:
         for rule_id, pcc_rule in default_pcc_rules.items():
             pcc_rules_database[rule_id] = pcc_rule
     
+    def _initialize_decision_templates(self):
+        """Pre-build the SM policy decision for each DNN category"""
+        self._decision_templates: Dict[str, SmPolicyDecision] = {}
+        # DNN -> template, filled as DNNs are first seen
+        self._templates_by_dnn: Dict[str, SmPolicyDecision] = {}
+        for category, service_rule in DNN_SERVICE_RULES.items():
+            # Apply default internet rule for all sessions
+            pcc_rules = {"rule_internet_default": pcc_rules_database["rule_internet_default"]}
+            qos_decs = {"qos_internet": qos_data_database["qos_internet"]}
+            if service_rule:
+                rule_id, qos_id = service_rule
+                pcc_rules[rule_id] = pcc_rules_database[rule_id]
+                qos_decs[qos_id] = qos_data_database[qos_id]
+            
+            self._decision_templates[category] = SmPolicyDecision.construct(
+                pccRules=pcc_rules,
+                qosDecs=qos_decs,
+                # Online and offline charging are always enabled
+                online=True,
+                offline=True,
+                # Shared immutable tuple; construct() stores it as-is
+                policyCtrlReqTriggers=DEFAULT_POLICY_TRIGGERS,
+                suppFeat=self.supported_features
+            )
+    
     def create_sm_policy_decision(self, context_data: SmPolicyContextData) -> SmPolicyDecision:
         """Create SM policy decision based on context data per TS 29.512"""
         
-        # Determine applicable PCC rules based on subscription and network policies
-        applicable_pcc_rules = {}
-        applicable_qos_data = {}
-        
-        # Apply default internet rule for all sessions
-        applicable_pcc_rules["rule_internet_default"] = pcc_rules_database["rule_internet_default"]
-        applicable_qos_data["qos_internet"] = qos_data_database["qos_internet"]
-        
-        # Apply service-specific rules based on DNN and subscription
-        if context_data.dnn == "ims":
-            applicable_pcc_rules["rule_ims_signalling"] = pcc_rules_database["rule_ims_signalling"]
-            applicable_qos_data["qos_ims"] = qos_data_database["qos_ims"]
-        elif "video" in context_data.dnn:
-            applicable_pcc_rules["rule_video_streaming"] = pcc_rules_database["rule_video_streaming"]
-            applicable_qos_data["qos_video"] = qos_data_database["qos_video"]
-        elif "gaming" in context_data.dnn:
-            applicable_pcc_rules["rule_gaming"] = pcc_rules_database["rule_gaming"]
-            applicable_qos_data["qos_gaming"] = qos_data_database["qos_gaming"]
+        # Apply service-specific rules based on DNN
+        dnn = context_data.dnn
+        template = self._templates_by_dnn.get(dnn)
+        if template is None:
+            if dnn == "ims":
+                category = "ims"
+            else:
+                category = next((c for c in DNN_SUBSTRING_CATEGORIES if c in dnn), "default")
+            template = self._decision_templates[category]
+            if len(self._templates_by_dnn) < DNN_TEMPLATE_CACHE_MAX:
+                self._templates_by_dnn[dnn] = template
         
-        # Create policy control request triggers
-        policy_triggers = [
-            PolicyControlRequestTrigger.PLMN_CH,
-            PolicyControlRequestTrigger.RES_MO_RE,
-            PolicyControlRequestTrigger.AC_TY_CH,
-            PolicyControlRequestTrigger.UE_IP_CH,
-            PolicyControlRequestTrigger.AN_CH_COR,
-            PolicyControlRequestTrigger.US_RE,
-            PolicyControlRequestTrigger.APP_STA,
-            PolicyControlRequestTrigger.APP_STO,
-            PolicyControlRequestTrigger.DEF_QOS_CH,
-            PolicyControlRequestTrigger.SE_AMBR_CH,
-            PolicyControlRequestTrigger.QOS_NOTIF,
-            PolicyControlRequestTrigger.SUCC_RESOURCE_ALLO,
-            PolicyControlRequestTrigger.RAI_CH,
-            PolicyControlRequestTrigger.PCC_UPD
-        ]
-        
-        # Determine charging configuration
-        online_charging = context_data.online or True
-        offline_charging = context_data.offline or True
-        
-        # Set revalidation time (24 hours from now)
-        revalidation_time = datetime.utcnow() + timedelta(hours=24)
-        
-        # Create SM policy decision
-        sm_policy_decision = SmPolicyDecision(
-            pccRules=applicable_pcc_rules,
-            qosDecs=applicable_qos_data,
-            online=online_charging,
-            offline=offline_charging,
-            policyCtrlReqTriggers=policy_triggers,
-            revalidationTime=revalidation_time,
-            supi=context_data.supi,
-            suppFeat=self.supported_features
-        )
-        
-        return sm_policy_decision
+        # Shallow copy of the template; the rule and QoS maps stay shared
+        # until an update replaces them
+        return template.copy(update={
+            "supi": context_data.supi,
+            "revalidationTime": self.revalidation_time
+        })
     
     def update_sm_policy_decision(self, policy_association_id: str, 
                                  triggers: List[PolicyControlRequestTrigger],
                                  context_updates: Dict = None) -> SmPolicyDecision:
         """Update SM policy decision based on triggers"""
         
-        if policy_association_id not in sm_policy_decisions:
+        record = sm_policies.get(policy_association_id)
+        if record is None:
             raise ValueError(f"Policy association {policy_association_id} not found")
         
-        current_decision = sm_policy_decisions[policy_association_id]
-        updated_decision = current_decision.copy()
+        current_decision = record.decision
+        # Shallow copy with private rule and QoS maps for the handlers to edit;
+        # the rules and QoS data themselves are frozen and stay shared
+        updated_decision = current_decision.copy(update={
+            "pccRules": dict(current_decision.pccRules),
+            "qosDecs": dict(current_decision.qosDecs)
+        })
         
-        # Process different triggers
-        for trigger in triggers:
-            if trigger == PolicyControlRequestTrigger.RES_MO_RE:
-                # Resource modification
-                if context_updates and "qos_requirements" in context_updates:
-                    # Update QoS decisions based on new requirements
-                    new_qos = context_updates["qos_requirements"]
-                    if new_qos.get("fiveqi") == 1:  # Conversational voice
-                        updated_decision.qosDecs["qos_voice"] = QosData(
-                            qosId="qos_voice",
-                            fiveqi=1,
-                            gbrUl="64 Kbps",
-                            gbrDl="64 Kbps",
-                            arp=Arp(priority_level=2)
-                        )
-            
-            elif trigger == PolicyControlRequestTrigger.APP_STA:
-                # Application start
-                if context_updates and "app_id" in context_updates:
-                    app_id = context_updates["app_id"]
-                    if app_id == "video_streaming_app":
-                        updated_decision.pccRules["rule_video_streaming"] = pcc_rules_database["rule_video_streaming"]
-                        updated_decision.qosDecs["qos_video"] = qos_data_database["qos_video"]
-            
-            elif trigger == PolicyControlRequestTrigger.APP_STO:
-                # Application stop
-                if context_updates and "app_id" in context_updates:
-                    app_id = context_updates["app_id"]
-                    if app_id == "video_streaming_app" and "rule_video_streaming" in updated_decision.pccRules:
-                        del updated_decision.pccRules["rule_video_streaming"]
-                        del updated_decision.qosDecs["qos_video"]
-            
-            elif trigger == PolicyControlRequestTrigger.QOS_NOTIF:
-                # QoS notification
-                if context_updates and "qos_notification" in context_updates:
-                    # Adjust QoS based on network conditions
-                    qos_notif = context_updates["qos_notification"]
-                    if qos_notif.get("congestion_level") == "high":
-                        # Reduce bit rates for non-critical flows
-                        for qos_id, qos_data in updated_decision.qosDecs.items():
-                            if qos_data.fiveqi == 9:  # Best effort
-                                qos_data.maxbrUl = "500 Kbps"
-                                qos_data.maxbrDl = "1 Mbps"
+        # Process different triggers; those without a handler leave the decision as is
+        if context_updates:
+            for trigger in triggers:
+                handler = self._trigger_handlers.get(trigger)
+                if handler is not None:
+                    handler(updated_decision, context_updates)
         
         # Update revalidation time
-        updated_decision.revalidationTime = datetime.utcnow() + timedelta(hours=24)
+        updated_decision.revalidationTime = self.revalidation_time
         
         return updated_decision
+    
+    def _apply_resource_modification(self, decision: SmPolicyDecision, context_updates: Dict):
+        if "qos_requirements" in context_updates:
+            # Update QoS decisions based on new requirements
+            new_qos = context_updates["qos_requirements"]
+            if new_qos.get("fiveqi") == 1:  # Conversational voice
+                decision.qosDecs["qos_voice"] = QosData.construct(
+                    qosId="qos_voice",
+                    fiveqi=1,
+                    gbrUl="64 Kbps",
+                    gbrDl="64 Kbps",
+                    arp=Arp.construct(priority_level=2)
+                )
+    
+    def _apply_app_start(self, decision: SmPolicyDecision, context_updates: Dict):
+        if "app_id" in context_updates:
+            app_id = context_updates["app_id"]
+            if app_id == "video_streaming_app":
+                decision.pccRules["rule_video_streaming"] = pcc_rules_database["rule_video_streaming"]
+                decision.qosDecs["qos_video"] = qos_data_database["qos_video"]
+    
+    def _apply_app_stop(self, decision: SmPolicyDecision, context_updates: Dict):
+        if "app_id" in context_updates:
+            app_id = context_updates["app_id"]
+            if app_id == "video_streaming_app" and "rule_video_streaming" in decision.pccRules:
+                del decision.pccRules["rule_video_streaming"]
+                del decision.qosDecs["qos_video"]
+    
+    def _apply_qos_notification(self, decision: SmPolicyDecision, context_updates: Dict):
+        if "qos_notification" in context_updates:
+            # Adjust QoS based on network conditions
+            qos_notif = context_updates["qos_notification"]
+            if qos_notif.get("congestion_level") == "high":
+                # Reduce bit rates for non-critical flows; QoS data is frozen and
+                # shared with qos_data_database, so store an updated copy
+                for qos_id, qos_data in decision.qosDecs.items():
+                    if qos_data.fiveqi == 9:  # Best effort
+                        decision.qosDecs[qos_id] = qos_data.copy(
+                            update={"maxbrUl": "500 Kbps", "maxbrDl": "1 Mbps"}
+                        )
+
+def parse_json_body(model, raw: bytes):
+    """Decode a JSON body with orjson and validate it, failing the way FastAPI body parsing does"""
+    if not raw:
+        raise RequestValidationError([ErrorWrapper(MissingError(), loc=("body",))])
+    try:
+        data = orjson.loads(raw)
+    except orjson.JSONDecodeError as e:
+        raise RequestValidationError([ErrorWrapper(e, loc=("body", e.pos))])
+    try:
+        return model.validate(data)
+    except (TypeError, ValueError) as e:
+        raise RequestValidationError([ErrorWrapper(e, loc=("body",))])
 
 pcf_instance = PCF()
 
+async def _refresh_revalidation_time():
+    while True:
+        pcf_instance.revalidation_time = datetime.utcnow() + REVALIDATION_PERIOD
+        await asyncio.sleep(REVALIDATION_REFRESH_INTERVAL)
+
 @asynccontextmanager
 async def lifespan(app: FastAPI):
     # Startup - Register with NRF per TS 29.510
+    global pcf_http
+    pcf_http = httpx.AsyncClient(
+        timeout=5.0,
+        transport=httpx.AsyncHTTPTransport(
+            retries=2,
+            limits=httpx.Limits(max_keepalive_connections=50)
+        )
+    )
+    
     nf_profile = {
         "nfInstanceId": pcf_instance.nf_instance_id,
         "nfType": "PCF",
@@ -480,73 +614,92 @@ async def lifespan(app: FastAPI):
         }
     }
     
+    pcf_instance.nf_profile_body = orjson.dumps(nf_profile)
+    
     try:
-        response = requests.post(f"{nrf_url}/nnrf-nfm/v1/nf-instances/{pcf_instance.nf_instance_id}",
-                               json=nf_profile)
+        response = await pcf_http.put(f"{nrf_url}/nnrf-nfm/v1/nf-instances/{pcf_instance.nf_instance_id}",
+                                      content=pcf_instance.nf_profile_body, headers=_JSON_HEADERS)
         if response.status_code in [200, 201]:
             logger.info("PCF registered with NRF successfully")
         else:
             logger.warning(f"PCF registration with NRF failed: {response.status_code}")
-    except requests.RequestException as e:
+    except httpx.HTTPError as e:
         logger.error(f"Failed to register PCF with NRF: {e}")
     
+    revalidation_refresher = asyncio.create_task(_refresh_revalidation_time())
+    
     yield
     
     # Shutdown
+    revalidation_refresher.cancel()
     try:
-        requests.delete(f"{nrf_url}/nnrf-nfm/v1/nf-instances/{pcf_instance.nf_instance_id}")
+        await pcf_http.delete(f"{nrf_url}/nnrf-nfm/v1/nf-instances/{pcf_instance.nf_instance_id}")
         logger.info("PCF deregistered from NRF")
     except:
         pass
+    finally:
+        await pcf_http.aclose()
 
 app = FastAPI(
     title="PCF - Policy Control Function",
     description="3GPP TS 29.507, TS 29.512, TS 29.514 compliant PCF implementation",
     version="1.0.0",
+    default_response_class=ORJSONResponse,
     lifespan=lifespan
 )
 
 # 3GPP TS 29.512 § 5.2.2.2.1 - Create SM Policy Association
-@app.post("/npcf-smpolicycontrol/v1/sm-policies", response_model=SmPolicyDecision)
-async def create_sm_policy(context_data: SmPolicyContextData):
+@app.post("/npcf-smpolicycontrol/v1/sm-policies", response_model=SmPolicyDecision,
+          openapi_extra={"requestBody": {
+              "required": True,
+              "content": {"application/json": {"schema": SmPolicyContextData.schema()}}
+          }})
+async def create_sm_policy(request: Request):
     """
     Create SM Policy Association per 3GPP TS 29.512
     """
+    # Single orjson decode of the raw body instead of FastAPI's stdlib json pass
+    context_data = parse_json_body(SmPolicyContextData, await request.body())
+    
     with tracer.start_as_current_span("pcf_create_sm_policy") as span:
-        span.set_attribute("3gpp.service", "Npcf_SMPolicyControl")
-        span.set_attribute("3gpp.operation", "Create")
-        span.set_attribute("ue.supi", context_data.supi)
-        span.set_attribute("pdu.session.id", str(context_data.pduSessionId))
-        span.set_attribute("dnn", context_data.dnn)
+        recording = span.is_recording()
+        if recording:
+            span.set_attributes({
+                **_SM_CREATE_SPAN_ATTRS,
+                "ue.supi": context_data.supi,
+                "pdu.session.id": str(context_data.pduSessionId),
+                "dnn": context_data.dnn
+            })
         
         try:
             # Generate policy association ID
-            policy_association_id = str(uuid.uuid4())
+            policy_association_id = pcf_instance.new_association_id()
             
             # Create policy association
-            policy_association = PolicyAssociation(
+            policy_association = PolicyAssociation.construct(
                 request=context_data,
                 supi=context_data.supi,
                 notificationUri=context_data.notificationUri,
                 suppFeat=pcf_instance.supported_features
             )
-            policy_associations[policy_association_id] = policy_association
             
             # Create SM policy decision
             sm_policy_decision = pcf_instance.create_sm_policy_decision(context_data)
-            sm_policy_decisions[policy_association_id] = sm_policy_decision
+            body = serialize_sm_policy_decision(sm_policy_decision)
+            sm_policies[policy_association_id] = SmPolicyRecord(policy_association, sm_policy_decision, body)
             
-            span.set_attribute("policy.association.id", policy_association_id)
-            span.set_attribute("pcc.rules.count", len(sm_policy_decision.pccRules or {}))
-            span.set_attribute("qos.decisions.count", len(sm_policy_decision.qosDecs or {}))
-            span.set_attribute("status", "SUCCESS")
+            if recording:
+                span.set_attributes({
+                    "policy.association.id": policy_association_id,
+                    "pcc.rules.count": len(sm_policy_decision.pccRules or {}),
+                    "qos.decisions.count": len(sm_policy_decision.qosDecs or {}),
+                    "status": "SUCCESS"
+                })
             
             logger.info(f"SM Policy created for SUPI: {context_data.supi}, PDU Session: {context_data.pduSessionId}")
             
-            # Add policy association ID to response headers (would be in Location header in real implementation)
-            sm_policy_decision.policyCtrlReqTriggers = sm_policy_decision.policyCtrlReqTriggers
-            
-            return sm_policy_decision
+            # The decision was built internally and serialized on store; no response validation needed
+            return Response(content=body, media_type="application/json")
             
         except Exception as e:
             span.set_attribute("error", str(e))
@@ -559,10 +712,12 @@ async def get_sm_policy(smPolicyId: str = Path(..., description="SM Policy ID"))
     """
     Get SM Policy Association per 3GPP TS 29.512
     """
-    if smPolicyId not in sm_policy_decisions:
+    record = sm_policies.get(smPolicyId)
+    if record is None:
         raise HTTPException(status_code=404, detail="SM Policy Association not found")
     
-    return sm_policy_decisions[smPolicyId]
+    # Serialized when the decision was stored; decisions only change on PATCH/DELETE
+    return Response(content=record.body, media_type="application/json")
 
 # 3GPP TS 29.512 § 5.2.2.4.1 - Update SM Policy Association
 @app.patch("/npcf-smpolicycontrol/v1/sm-policies/{smPolicyId}", response_model=SmPolicyDecision)
@@ -575,7 +730,8 @@ async def update_sm_policy(
     """
     with tracer.start_as_current_span("pcf_update_sm_policy") as span:
         try:
-            if smPolicyId not in sm_policy_decisions:
+            record = sm_policies.get(smPolicyId)
+            if record is None:
                 raise HTTPException(status_code=404, detail="SM Policy Association not found")
             
             # Extract triggers and context updates
@@ -589,14 +745,14 @@ async def update_sm_policy(
             updated_decision = pcf_instance.update_sm_policy_decision(
                 smPolicyId, triggers, context_updates
             )
-            sm_policy_decisions[smPolicyId] = updated_decision
+            body = record.set_decision(updated_decision)
             
-            span.set_attribute("triggers.count", len(triggers))
-            span.set_attribute("status", "SUCCESS")
+            if span.is_recording():
+                span.set_attributes({"triggers.count": len(triggers), "status": "SUCCESS"})
             
             logger.info(f"SM Policy updated for association: {smPolicyId}")
             
-            return updated_decision
+            return Response(content=body, media_type="application/json")
             
         except Exception as e:
             span.set_attribute("error", str(e))
@@ -611,14 +767,9 @@ async def delete_sm_policy(smPolicyId: str = Path(..., description="SM Policy ID
     """
     with tracer.start_as_current_span("pcf_delete_sm_policy") as span:
         try:
-            if smPolicyId not in sm_policy_decisions:
-                raise HTTPException(status_code=404, detail="SM Policy Association not found")
-            
             # Clean up policy data
-            if smPolicyId in policy_associations:
-                del policy_associations[smPolicyId]
-            if smPolicyId in sm_policy_decisions:
-                del sm_policy_decisions[smPolicyId]
+            if sm_policies.pop(smPolicyId, None) is None:
+                raise HTTPException(status_code=404, detail="SM Policy Association not found")
             
             span.set_attribute("status", "SUCCESS")
             logger.info(f"SM Policy deleted for association: {smPolicyId}")
@@ -639,10 +790,10 @@ async def create_am_policy(am_context_data: Dict):
     with tracer.start_as_current_span("pcf_create_am_policy") as span:
         try:
             # Generate policy association ID
-            policy_association_id = str(uuid.uuid4())
+            policy_association_id = pcf_instance.new_association_id()
             
             # Create AM policy data
-            am_policy = AmPolicyData(
+            am_policy = AmPolicyData.construct(
                 praInfos={
                     "pra_001": {
                         "praId": "pra_001",
@@ -655,8 +806,8 @@ async def create_am_policy(am_context_data: Dict):
             )
             am_policy_data[policy_association_id] = am_policy
             
-            span.set_attribute("policy.association.id", policy_association_id)
-            span.set_attribute("status", "SUCCESS")
+            if span.is_recording():
+                span.set_attributes({"policy.association.id": policy_association_id, "status": "SUCCESS"})
             
             logger.info(f"AM Policy created for association: {policy_association_id}")
             
@@ -719,8 +870,8 @@ async def pcf_status():
     """Get PCF status"""
     return {
         "status": "operational",
-        "active_policy_associations": len(policy_associations),
-        "sm_policy_decisions": len(sm_policy_decisions),
+        "active_policy_associations": len(sm_policies),
+        "sm_policy_decisions": len(sm_policies),
         "am_policy_data": len(am_policy_data),
         "total_pcc_rules": len(pcc_rules_database),
         "total_qos_data": len(qos_data_database),
@@ -735,19 +886,19 @@ def health_check():
         "service": "PCF",
         "compliance": "3GPP TS 29.507, TS 29.512, TS 29.514",
         "version": "1.0.0",
-        "active_policies": len(policy_associations)
+        "active_policies": len(sm_policies)
     }
 
 @app.get("/metrics")
 def get_metrics():
     """Metrics endpoint for monitoring"""
     return {
-        "total_policy_associations": len(policy_associations),
-        "active_sm_policies": len(sm_policy_decisions),
+        "total_policy_associations": len(sm_policies),
+        "active_sm_policies": len(sm_policies),
         "active_am_policies": len(am_policy_data),
         "pcc_rules_configured": len(pcc_rules_database),
         "qos_data_configured": len(qos_data_database)
     }
 
 if __name__ == "__main__":
-    uvicorn.run(app, host="127.0.0.1", port=9007)
\ No newline at end of file
+    uvicorn.run(app, host="127.0.0.1", port=9007, loop="auto", http="httptools")
\ No newline at end of file
@@ -2,11 +2,11 @@
 # Enhanced with 3GPP TS 23.502 compliance for PDU Session Establishment
 from fastapi import FastAPI, Request, HTTPException
 import uvicorn
-import requests
+import httpx
 import logging
 import json
 from contextlib import asynccontextmanager
-from typing import Dict
+from typing import Dict, Optional
 from datetime import datetime
 import os
 from opentelemetry import trace
@@ -38,40 +38,48 @@ tracer = trace.get_tracer(__name__)
 nrf_url = "http://127.0.0.1:8000"
 upf_url = None  # Will be discovered from NRF
 
+# Shared keep-alive HTTP client for NRF and N4 (UPF) calls, managed by lifespan
+smf_http: Optional[httpx.AsyncClient] = None
+
 # SMF Session contexts - stores PDU session state
 session_contexts: Dict[str, Dict] = {}
 
 @asynccontextmanager
 async def lifespan(app: FastAPI):
-    global upf_url
+    global upf_url, smf_http
     # Startup
+    smf_http = httpx.AsyncClient(
+        timeout=5.0,
+        limits=httpx.Limits(max_keepalive_connections=100)
+    )
+    
     nf_registration = {
         "nf_type": "SMF",
         "ip": "127.0.0.1",
         "port": 9001
     }
     try:
-        response = requests.post(f"{nrf_url}/register", json=nf_registration)
+        response = await smf_http.post(f"{nrf_url}/register", json=nf_registration)
         response.raise_for_status()
         logger.info("SMF registered with NRF")
         
         # Discover UPF for N4 interface
-        upf_info = requests.get(f"{nrf_url}/discover/UPF").json()
+        upf_info = (await smf_http.get(f"{nrf_url}/discover/UPF")).json()
         if 'message' in upf_info:
             logger.error(f"UPF discovery failed: {upf_info['message']}")
         else:
             upf_url = f"http://{upf_info.get('ip')}:{upf_info.get('port')}"
             logger.info(f"UPF discovered at {upf_url}")
-    except requests.RequestException as e:
+    except (httpx.HTTPError, ValueError) as e:
         logger.error(f"Failed to register SMF with NRF or discover UPF: {str(e)}")
     
     yield
     # Shutdown
-    # Add any cleanup code here if needed
+    await smf_http.aclose()
 
 app = FastAPI(lifespan=lifespan)
 
-def _send_pfcp_establishment_request(pdu_session: dict) -> dict:
+async def _send_pfcp_establishment_request(pdu_session: dict) -> dict:
     """
     Models sending a PFCP Session Establishment Request to the UPF over N4.
     Reference: 3GPP TS 29.244 - PFCP Protocol
@@ -125,7 +133,7 @@ def _send_pfcp_establishment_request(pdu_session: dict) -> dict:
         span.set_attribute("pfcp.seid", pfcp_request['seid'])
         
         try:
-            response = requests.post(n4_endpoint, json=pfcp_request, timeout=5)
+            response = await smf_http.post(n4_endpoint, json=pfcp_request)
             response.raise_for_status()
             n4_response = response.json()
             
@@ -136,7 +144,7 @@ def _send_pfcp_establishment_request(pdu_session: dict) -> dict:
             })
             
             return n4_response
-        except requests.RequestException as e:
+        except (httpx.HTTPError, ValueError) as e:
             logger.error(f"SMF -> UPF: N4 interface error: {e}")
             span.record_exception(e)
             raise HTTPException(status_code=502, detail=f"N4 interface error: {e}")
@@ -180,7 +188,7 @@ async def create_sm_context(request: Request):
                 "sessionState": "ESTABLISHING"
             }
             
-            n4_response = _send_pfcp_establishment_request(session_context)
+            n4_response = await _send_pfcp_establishment_request(session_context)
             
             # 3. Store session context
             session_key = f"{supi}:{pdu_session_id}"
@@ -243,4 +251,4 @@ def smf_service():
     return {"message": "SMF service response"}
 
 if __name__ == "__main__":
-    uvicorn.run(app, host="127.0.0.1", port=9001)
\ No newline at end of file
+    uvicorn.run(app, host="127.0.0.1", port=9001, loop="auto", http="httptools")
\ No newline at end of file
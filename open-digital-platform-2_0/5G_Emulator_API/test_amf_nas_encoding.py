@@ -0,0 +1,92 @@
+# File location: 5G_Emulator_API/test_amf_nas_encoding.py
+import os
+import sys
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "core_network"))
+
+import amf_nas
+from amf_nas import amf_nas_instance, Snssai
+
+SUPI = "imsi-001010000000001"
+
+def decode_plmn(data: bytes):
+    mcc = f"{data[0] & 0x0F}{data[0] >> 4}{data[1] & 0x0F}"
+    mnc = f"{data[2] & 0x0F}{data[2] >> 4}"
+    if data[1] >> 4 != 0xF:
+        mnc += str(data[1] >> 4)
+    return {"mcc": mcc, "mnc": mnc}
+
+def decode_registration_accept(pdu: bytes):
+    """Split a plain Registration Accept into its header, result and TLV IEs"""
+    assert pdu[0] == 0x7E and pdu[1] == 0 and pdu[2] == amf_nas.REG_ACCEPT
+    assert pdu[3] == 1
+    decoded = {"registration_result": pdu[4], "ies": {}}
+    offset = 5
+    while offset < len(pdu):
+        iei = pdu[offset]
+        if iei == 0x77:  # TLV-E
+            length = int.from_bytes(pdu[offset + 1:offset + 3], "big")
+            value_start = offset + 3
+        else:
+            length = pdu[offset + 1]
+            value_start = offset + 2
+        decoded["ies"][iei] = pdu[value_start:value_start + length]
+        offset = value_start + length
+    assert offset == len(pdu)
+    return decoded
+
+def encode(requested_nssai=None, **overrides):
+    accept = amf_nas_instance.create_registration_accept(SUPI, requested_nssai)
+    accept.update(overrides)
+    return accept, amf_nas_instance.encode_registration_accept(accept)
+
+def test_header_guti_tai_and_nssai():
+    accept, pdu = encode([Snssai(sst=1, sd="010203"), Snssai(sst=2)])
+    decoded = decode_registration_accept(pdu)
+    assert decoded["registration_result"] == 1
+
+    guti = decoded["ies"][0x77]
+    assert len(guti) == 11 and guti[0] == 0xF2
+    assert decode_plmn(guti[1:4]) == {"mcc": "001", "mnc": "01"}
+    assert guti[4] == 0x01  # AMF Region ID
+    assert int.from_bytes(guti[5:7], "big") == (0x001 << 6) | 0x01  # AMF Set ID | AMF Pointer
+    assert guti[7:].hex().upper() == accept["mobile_identity"][-8:]
+
+    tai = decoded["ies"][0x54]
+    assert tai[0] == 0x00  # type 00, one element
+    assert decode_plmn(tai[1:4]) == {"mcc": "001", "mnc": "01"}
+    assert tai[4:7].hex() == "000001"
+
+    nssai = decoded["ies"][0x15]
+    assert nssai == bytes((4, 1, 0x01, 0x02, 0x03, 1, 2))
+
+def test_network_feature_support_two_bit_fields():
+    _, pdu = encode()
+    nfs = decode_registration_accept(pdu)["ies"][0x21]
+    assert len(nfs) == 2
+    octet3, octet4 = nfs
+    assert octet3 & 0b1 == 1              # IMS-VoPS-3GPP
+    assert octet3 >> 1 & 0b1 == 1         # IMS-VoPS-N3GPP
+    assert octet3 >> 2 & 0b11 == 0b01     # EMC: NR connected to 5GCN
+    assert octet3 >> 4 & 0b11 == 0b01     # EMF: NR connected to 5GCN
+    assert octet3 >> 6 == 0               # IWK N26 and MPSI not set
+    assert octet4 == 0b1                  # EMCN3
+
+def test_network_feature_support_explicit_values():
+    nfs_values = {"ims_vops_3gpp": False, "ims_vops_n3gpp": True,
+                  "emc_3gpp": 0b11, "emf_3gpp": 0b10, "emc_n3gpp": False}
+    _, pdu = encode(network_feature_support=nfs_values)
+    octet3, octet4 = decode_registration_accept(pdu)["ies"][0x21]
+    assert octet3 == 0b10 | 0b11 << 2 | 0b10 << 4
+    assert octet4 == 0
+
+def test_optional_ies_omitted():
+    _, pdu = encode(tai_list=None, allowed_nssai=None, network_feature_support=None)
+    assert set(decode_registration_accept(pdu)["ies"]) == {0x77}
+
+if __name__ == "__main__":
+    test_header_guti_tai_and_nssai()
+    test_network_feature_support_two_bit_fields()
+    test_network_feature_support_explicit_values()
+    test_optional_ies_omitted()
+    print("AMF NAS encoding tests passed")
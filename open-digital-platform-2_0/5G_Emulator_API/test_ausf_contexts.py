@@ -0,0 +1,119 @@
+# File location: 5G_Emulator_API/test_ausf_contexts.py
+import os
+import sys
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "core_network"))
+
+import ausf
+from ausf import AuthContextStore, AuthCtx, AUTH_ONGOING, AUTH_SUCCESS
+
+SECOND_NS = 1_000_000_000
+
+def make_ctx(timestamp_ns):
+    return AuthCtx(supi="imsi-001010000000001", serving_network_name="5G:mnc001.mcc001.3gppnetwork.org",
+                   auth_type="5G_AKA", rand="00", autn="00", hxresstar="00", kausf="00",
+                   timestamp_ns=timestamp_ns)
+
+def ids_in_one_shard(store, count):
+    # Collect ids that hash to the same shard as the first one
+    target = store._shard("ctx-0")
+    ids = []
+    n = 0
+    while len(ids) < count:
+        ctx_id = f"ctx-{n}"
+        if store._shard(ctx_id) is target:
+            ids.append(ctx_id)
+        n += 1
+    return ids
+
+def test_shard_cap_evicts_oldest():
+    store = AuthContextStore(max_size=64, shards=16)
+    assert store.shard_max == 4
+    ids = ids_in_one_shard(store, 6)
+    for i, ctx_id in enumerate(ids):
+        store[ctx_id] = make_ctx(i)
+    # Only the four newest contexts of the shard remain
+    assert [ctx_id in store for ctx_id in ids] == [False, False, True, True, True, True]
+    assert len(store) == 4
+    assert store.count(AUTH_ONGOING) == 4
+
+def test_restore_existing_id_does_not_evict():
+    store = AuthContextStore(max_size=64, shards=16)
+    ids = ids_in_one_shard(store, 4)
+    for i, ctx_id in enumerate(ids):
+        store[ctx_id] = make_ctx(i)
+    store[ids[0]] = make_ctx(0)
+    assert all(ctx_id in store for ctx_id in ids)
+    assert store.count(AUTH_ONGOING) == 4
+
+def test_reaper_expires_ongoing_after_ttl():
+    store = AuthContextStore()
+    now = 1_000 * SECOND_NS
+    store["old"] = make_ctx(now - ausf.AUTH_CTX_TTL_ONGOING_NS - 1)
+    store["fresh"] = make_ctx(now - 1)
+    assert store.reap(now) == 1
+    assert "old" not in store and "fresh" in store
+    assert store.count(AUTH_ONGOING) == 1
+
+def test_reaper_expires_completed_relative_to_completion():
+    store = AuthContextStore()
+    now = 10_000 * SECOND_NS
+    created = now - ausf.AUTH_CTX_TTL_COMPLETED_NS - SECOND_NS
+
+    # Completed past the completed TTL: evicted
+    store["stale"] = make_ctx(created)
+    store.complete("stale", AUTH_SUCCESS, now - ausf.AUTH_CTX_TTL_COMPLETED_NS - 1)
+
+    # Created past the completed TTL but completed recently: kept
+    store["recent"] = make_ctx(created)
+    store.complete("recent", AUTH_SUCCESS, now - SECOND_NS)
+
+    assert store.reap(now) == 1
+    assert "recent" in store and "stale" not in store
+    assert store.count(AUTH_SUCCESS) == 1
+
+def test_reaper_keeps_completed_within_ongoing_ttl():
+    store = AuthContextStore()
+    now = 1_000 * SECOND_NS
+    store["done"] = make_ctx(now - SECOND_NS)
+    store.complete("done", AUTH_SUCCESS, now)
+    assert store.reap(now + ausf.AUTH_CTX_TTL_ONGOING_NS) == 0
+    assert store.reap(now + ausf.AUTH_CTX_TTL_COMPLETED_NS + 1) == 1
+
+def test_completed_backlog_does_not_block_ongoing_expiry():
+    store = AuthContextStore(max_size=64, shards=16)
+    ids = ids_in_one_shard(store, 4)
+    now = 1_000 * SECOND_NS
+    created = now - ausf.AUTH_CTX_TTL_ONGOING_NS - SECOND_NS
+    # Older completed contexts, still inside the completed TTL
+    for ctx_id in ids[:3]:
+        store[ctx_id] = make_ctx(created)
+        store.complete(ctx_id, AUTH_SUCCESS, now - SECOND_NS)
+    # A newer ongoing context, past the ongoing TTL
+    store[ids[3]] = make_ctx(created + 1)
+    assert store.reap(now) == 1
+    assert ids[3] not in store
+    assert all(ctx_id in store for ctx_id in ids[:3])
+    assert store.count(AUTH_ONGOING) == 0 and store.count(AUTH_SUCCESS) == 3
+
+def test_completion_moves_context_between_queues():
+    store = AuthContextStore(max_size=64, shards=16)
+    store["ctx"] = make_ctx(0)
+    index = store._index("ctx")
+    assert list(store._ongoing[index]) == ["ctx"] and not store._completed[index]
+    store.complete("ctx", AUTH_SUCCESS, 5)
+    assert not store._ongoing[index] and list(store._completed[index]) == ["ctx"]
+    assert store["ctx"].completed_at_ns == 5
+    del store["ctx"]
+    assert not store._completed[index] and len(store) == 0
+    assert store.count(AUTH_SUCCESS) == 0
+
+if __name__ == "__main__":
+    test_shard_cap_evicts_oldest()
+    test_restore_existing_id_does_not_evict()
+    test_reaper_expires_ongoing_after_ttl()
+    test_reaper_expires_completed_relative_to_completion()
+    test_reaper_keeps_completed_within_ongoing_ttl()
+    test_completed_backlog_does_not_block_ongoing_expiry()
+    test_completion_moves_context_between_queues()
+    print("AUSF context store tests passed")
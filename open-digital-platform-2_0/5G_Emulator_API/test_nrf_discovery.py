@@ -0,0 +1,151 @@
+# File location: 5G_Emulator_API/test_nrf_discovery.py
+import os
+import sys
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "core_network"))
+
+import orjson
+from fastapi.testclient import TestClient
+import nrf
+from nrf import app, nrf_state
+
+client = TestClient(app)
+DISC_URL = "/nnrf-disc/v1/nf-instances"
+
+def reset_registry():
+    nrf_state.profiles.clear()
+    nrf.rebuild_indexes()
+    nrf.bump_registry_version()
+
+def auth_headers():
+    token = client.post("/oauth2/token", json={"grant_type": "client_credentials"}).json()["access_token"]
+    return {"Authorization": f"Bearer {token}"}
+
+def register(headers, nf_id, nf_type, **fields):
+    profile = {"nfInstanceId": nf_id, "nfType": nf_type, **fields}
+    response = client.put(f"/nnrf-nfm/v1/nf-instances/{nf_id}", json=profile, headers=headers)
+    assert response.status_code == 200, response.text
+    return response
+
+def discovered_ids(response):
+    return sorted(nf["nfInstanceId"] for nf in response.json()["nfInstances"])
+
+def test_numeric_plmn_and_sst_are_coerced():
+    reset_registry()
+    headers = auth_headers()
+    register(headers, "amf-1", "AMF", plmnList=[{"mcc": "310", "mnc": "410"}],
+             sNssais=[{"sst": 1, "sd": "010203"}])
+    register(headers, "amf-2", "AMF", plmnList=[{"mcc": "001", "mnc": "01"}],
+             sNssais=[{"sst": 2, "sd": "020304"}])
+
+    # Numeric mcc/mnc match the string keys the profiles were indexed by
+    plmns = orjson.dumps([{"mcc": 310, "mnc": 410}]).decode()
+    response = client.get(DISC_URL, params={"target_nf_type": "AMF", "plmn_list": plmns}, headers=headers)
+    assert response.status_code == 200
+    assert discovered_ids(response) == ["amf-1"]
+
+    snssais = orjson.dumps([{"sst": "1", "sd": "010203"}]).decode()
+    response = client.get(DISC_URL, params={"target_nf_type": "AMF", "snssais": snssais}, headers=headers)
+    assert discovered_ids(response) == ["amf-1"]
+
+def test_malformed_filters_are_rejected():
+    reset_registry()
+    headers = auth_headers()
+    for params in ({"plmn_list": "not json"}, {"plmn_list": '[{"mcc": "310"}]'},
+                   {"snssais": '[{"sst": "x"}]'}, {"snssais": "[1]"}):
+        response = client.get(DISC_URL, params=params, headers=headers)
+        assert response.status_code == 400, params
+
+def search(headers, **params):
+    params.setdefault("target_nf_type", "AMF")
+    return client.get(DISC_URL, params=params, headers=headers)
+
+def test_if_none_match_returns_304():
+    reset_registry()
+    headers = auth_headers()
+    register(headers, "amf-1", "AMF")
+    first = search(headers)
+    etag = first.headers["ETag"]
+    response = search(headers=dict(headers, **{"If-None-Match": etag}))
+    assert response.status_code == 304
+    assert response.headers["ETag"] == etag
+    assert response.content == b""
+    # A stale ETag gets the full body
+    response = search(headers=dict(headers, **{"If-None-Match": '"stale"'}))
+    assert response.status_code == 200
+
+def test_cache_hit_returns_identical_bytes():
+    reset_registry()
+    headers = auth_headers()
+    register(headers, "amf-1", "AMF")
+    first = search(headers)
+    second = search(headers)
+    # searchId is random per build, so equal bodies mean the cached bytes were served
+    assert second.content == first.content
+    assert second.headers["ETag"] == first.headers["ETag"]
+
+def test_cache_expires_after_ttl():
+    reset_registry()
+    headers = auth_headers()
+    register(headers, "amf-1", "AMF")
+    ttl = nrf.DISCOVERY_CACHE_TTL
+    nrf.DISCOVERY_CACHE_TTL = 0.0
+    try:
+        first = search(headers)
+        second = search(headers)
+    finally:
+        nrf.DISCOVERY_CACHE_TTL = ttl
+    assert first.json()["searchId"] != second.json()["searchId"]
+    assert first.headers["ETag"] == second.headers["ETag"]
+
+def test_registry_changes_issue_new_etags():
+    reset_registry()
+    headers = auth_headers()
+    register(headers, "amf-1", "AMF")
+    etags = [search(headers).headers["ETag"]]
+
+    register(headers, "amf-2", "AMF")
+    response = search(headers)
+    etags.append(response.headers["ETag"])
+    assert discovered_ids(response) == ["amf-1", "amf-2"]
+
+    patch = [{"op": "replace", "path": "/nfStatus", "value": "SUSPENDED"}]
+    assert client.patch("/nnrf-nfm/v1/nf-instances/amf-2", json=patch, headers=headers).status_code == 200
+    response = search(headers)
+    etags.append(response.headers["ETag"])
+    assert discovered_ids(response) == ["amf-1"]
+
+    assert client.delete("/nnrf-nfm/v1/nf-instances/amf-1", headers=headers).status_code == 200
+    response = search(headers)
+    etags.append(response.headers["ETag"])
+    # A deregistered NF is never served from a cached body
+    assert discovered_ids(response) == []
+
+    assert len(set(etags)) == len(etags)
+    # The first ETag no longer revalidates
+    response = search(headers=dict(headers, **{"If-None-Match": etags[0]}))
+    assert response.status_code == 200
+
+def test_cache_evicts_oldest_at_max():
+    reset_registry()
+    headers = auth_headers()
+    register(headers, "amf-1", "AMF")
+    cache_max = nrf.DISCOVERY_CACHE_MAX
+    nrf.DISCOVERY_CACHE_MAX = 4
+    try:
+        etags = [search(headers, limit=n).headers["ETag"] for n in range(1, 6)]
+        assert len(nrf_state.discovery_cache) == 4
+        assert etags[0] not in nrf_state.discovery_cache
+        assert all(etag in nrf_state.discovery_cache for etag in etags[1:])
+    finally:
+        nrf.DISCOVERY_CACHE_MAX = cache_max
+
+if __name__ == "__main__":
+    test_numeric_plmn_and_sst_are_coerced()
+    test_malformed_filters_are_rejected()
+    test_if_none_match_returns_304()
+    test_cache_hit_returns_identical_bytes()
+    test_cache_expires_after_ttl()
+    test_registry_changes_issue_new_etags()
+    test_cache_evicts_oldest_at_max()
+    print("NRF discovery tests passed")
@@ -0,0 +1,107 @@
+# File location: 5G_Emulator_API/test_nrf_jwt.py
+import os
+import sys
+import time
+import hmac
+import hashlib
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "core_network"))
+
+import orjson
+import nrf
+from nrf import _jwt_sign, _jwt_verify, _b64url, nrf_instance, nrf_state
+
+def claims(**overrides):
+    now = int(time.time())
+    payload = {"iss": "test", "aud": nrf.JWT_AUDIENCE, "sub": "AMF", "iat": now, "exp": now + 60}
+    payload.update(overrides)
+    return payload
+
+def sign_with_header(header: dict, payload: dict) -> str:
+    signing_input = _b64url(orjson.dumps(header)) + b"." + _b64url(orjson.dumps(payload))
+    signature = hmac.new(nrf._JWT_KEY, signing_input, hashlib.sha256).digest()
+    return (signing_input + b"." + _b64url(signature)).decode("ascii")
+
+def verify(token: str):
+    nrf_state.verified_tokens.clear()
+    return nrf_instance.verify_access_token(token)
+
+def test_round_trip():
+    payload = claims(scope="nnrf-disc")
+    token = _jwt_sign(payload)
+    assert token.count(".") == 2 and "=" not in token
+    assert _jwt_verify(token) == payload
+    assert verify(token) == payload
+
+def test_issued_token_verifies():
+    token = nrf_instance.generate_access_token("AMF")
+    payload = verify(token)
+    assert payload["sub"] == "AMF"
+    assert payload["aud"] == nrf.JWT_AUDIENCE
+    assert payload["scope"] == nrf.JWT_DEFAULT_SCOPE
+
+def test_tampered_signature():
+    token = _jwt_sign(claims())
+    head, _, signature = token.rpartition(".")
+    flipped = ("A" if signature[0] != "A" else "B") + signature[1:]
+    assert _jwt_verify(f"{head}.{flipped}") is None
+    assert _jwt_verify(f"{head}.") is None
+
+def test_tampered_payload():
+    token = _jwt_sign(claims())
+    header, _, rest = token.partition(".")
+    _, _, signature = rest.partition(".")
+    forged = _b64url(orjson.dumps(claims(sub="admin"))).decode()
+    assert _jwt_verify(f"{header}.{forged}.{signature}") is None
+
+def test_wrong_header_or_alg():
+    payload = claims()
+    # Correctly keyed HMAC, but the header is not the pinned HS256 one
+    assert _jwt_verify(sign_with_header({"alg": "none", "typ": "JWT"}, payload)) is None
+    assert _jwt_verify(sign_with_header({"alg": "HS512", "typ": "JWT"}, payload)) is None
+    assert _jwt_verify(sign_with_header({"typ": "JWT", "alg": "HS256"}, payload)) is None
+    # Unsigned "none" token
+    unsigned = _b64url(orjson.dumps({"alg": "none"})) + b"." + _b64url(orjson.dumps(payload)) + b"."
+    assert _jwt_verify(unsigned.decode()) is None
+
+def test_missing_or_expired_exp():
+    now = int(time.time())
+    missing = claims()
+    del missing["exp"]
+    assert verify(_jwt_sign(missing)) is None
+    assert verify(_jwt_sign(claims(exp=now - 1))) is None
+    assert verify(_jwt_sign(claims(exp=now))) is None
+    assert verify(_jwt_sign(claims(exp="never"))) is None
+
+def test_wrong_aud():
+    assert verify(_jwt_sign(claims(aud="udm"))) is None
+    missing = claims()
+    del missing["aud"]
+    assert verify(_jwt_sign(missing)) is None
+
+def test_malformed_tokens():
+    for token in ("", ".", "..", "abc", "a.b", "a.b.c", "a.b.c.d", "!!!.@@@.###"):
+        assert _jwt_verify(token) is None, token
+        assert verify(token) is None, token
+    # Valid signature over a body that is not a JSON object
+    signing_input = nrf._JWT_HEADER_B64 + b"." + _b64url(b"[1, 2]")
+    signature = _b64url(hmac.new(nrf._JWT_KEY, signing_input, hashlib.sha256).digest())
+    assert _jwt_verify((signing_input + b"." + signature).decode()) is None
+
+def test_non_ascii_tokens():
+    token = _jwt_sign(claims())
+    assert _jwt_verify(token + "é") is None
+    assert _jwt_verify("é" + token) is None
+    assert verify("jwt.töken.sig") is None
+
+if __name__ == "__main__":
+    test_round_trip()
+    test_issued_token_verifies()
+    test_tampered_signature()
+    test_tampered_payload()
+    test_wrong_header_or_alg()
+    test_missing_or_expired_exp()
+    test_wrong_aud()
+    test_malformed_tokens()
+    test_non_ascii_tokens()
+    print("NRF JWT tests passed")